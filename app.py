@@ -1,18 +1,47 @@
 import warnings
 import folium
-from flask import Flask, request, render_template_string
-import json
+from flask import Flask, Response, request, jsonify, g
+from flask.logging import default_handler
 import os
+import hashlib
+import hmac
+import time
+import uuid
 import logging
 from logging.handlers import RotatingFileHandler
 from waitress import serve
 import socket
+import sys
+import threading
+import argparse
+from cache import VersionedCache, CompressedPage
+from store import LocationStore, JsonFileBackend
+from shared import FileLock, SharedSnapshot
+from prefork import serve_prefork
+from journal import JournalBackend
+from sqlite_backend import SQLiteBackend
+from geo import haversine_m, haversine_matrix, parse_bbox, in_bbox, to_feature, to_record
+from map_elements import ApiMarkerLoader, LazyPopups, LiveMarkerLayer, StaticDataLoader
+from spatial import GridIndex, CoordinateColumns
+from cluster import ClusterIndex, merged_clusters
+from facets import TypeIndex
+from itinerary import plan_route
+from search import SearchIndex, linear_search
+from importer import ImportReport, detect_format, iter_valid_batches
+from exporter import EXPORT_FORMATS, gzip_chunks
+from live import EventBroker
+from metrics import Registry
+from profiler import RequestProfiler
+from logging_setup import JsonFormatter, attach_queue_handlers, use_worker_file
+from publisher import SitePublisher
 
 # 创建Flask应用
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get(
     'SECRET_KEY', 'your-production-secret-key-change-this')
 app.config['DEBUG'] = False
+# 静态文件的URL带内容哈希，可以让浏览器长期缓存
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 3600
 
 # 禁用Flask开发服务器警告
 warnings.filterwarnings("ignore", message=".*development server.*")
@@ -21,9 +50,17 @@ warnings.filterwarnings("ignore", message=".*development server.*")
 if not os.path.exists('logs'):
     os.makedirs('logs')
 
+# 日志文件达到该大小时轮转
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+
+# 访问日志（JSON格式，每个请求一行，含请求ID和耗时），设置ACCESS_LOG=1开启
+ACCESS_LOG = os.environ.get('ACCESS_LOG', '0') == '1'
+
 # 文件日志
 file_handler = RotatingFileHandler(
-    'logs/app.log', maxBytes=10240, backupCount=10)
+    'logs/app.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+    encoding='utf-8')
 file_handler.setFormatter(logging.Formatter(
     '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
 ))
@@ -33,14 +70,73 @@ file_handler.setLevel(logging.INFO)
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 
-app.logger.addHandler(file_handler)
-app.logger.addHandler(console_handler)
+# 请求线程只把日志放入队列，由后台线程写文件和控制台
+app.logger.removeHandler(default_handler)
+log_listeners = [attach_queue_handlers(app.logger, file_handler, console_handler)]
+# 多进程时各工作进程改写自己的文件
+log_files = [file_handler]
 app.logger.setLevel(logging.INFO)
 
+access_logger = logging.getLogger('map.access')
+access_logger.propagate = False
+if ACCESS_LOG:
+    access_handler = RotatingFileHandler(
+        'logs/access.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8')
+    access_handler.setFormatter(JsonFormatter())
+    log_listeners.append(attach_queue_handlers(access_logger, access_handler))
+    log_files.append(access_handler)
+    access_logger.setLevel(logging.INFO)
+
 # 地图初始中心点
 INITIAL_CENTER = [22.5, 113.5]
 INITIAL_ZOOM = 9
 
+# 地图模式：static（标记直接生成在页面中）或 api（页面只含地图，标记按可见范围从接口加载）
+MAP_MODE = os.environ.get('MAP_MODE', 'static')
+
+# 景点数超过该值时主页面自动改用api模式，避免页面过大
+STATIC_MARKER_LIMIT = int(os.environ.get('STATIC_MARKER_LIMIT', 1000))
+
+# 主页面的缓存策略，默认浏览器每次都用ETag确认页面是否变化
+PAGE_CACHE_CONTROL = os.environ.get('PAGE_CACHE_CONTROL', 'no-cache')
+
+# 主页面ETag的一部分：在主进程中生成一次，各工作进程相同；重启（可能换了代码）后旧ETag失效
+PAGE_ETAG_SEED = uuid.uuid4().hex
+
+# 单个景点详情接口的缓存策略：景点编号是行号，删除或替换数据后同一编号会对应其他景点，
+# 默认每次向服务器确认（带ETag，未变化时返回304）
+DETAIL_CACHE_CONTROL = os.environ.get('DETAIL_CACHE_CONTROL', 'no-cache')
+
+# 管理接口（批量导入等）的口令，请求需带 X-Admin-Token 头；未设置时管理接口一律拒绝
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# 请求抽样性能分析：PROFILE_RATE为抽样比例（0为关闭），结果写入logs/profiles
+PROFILE_RATE = float(os.environ.get('PROFILE_RATE', 0))
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+
+# 批量导入每批校验的记录数
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+
+# 接口单次最多返回的景点数
+API_MAX_RESULTS = int(os.environ.get('API_MAX_RESULTS', 5000))
+
+# 行程规划最多的景点数，以及路线改进的时间上限（毫秒）
+ITINERARY_MAX_STOPS = int(os.environ.get('ITINERARY_MAX_STOPS', 500))
+ITINERARY_TIME_BUDGET_MS = float(os.environ.get('ITINERARY_TIME_BUDGET_MS', 300))
+
+# 景点类型对应的标记颜色和图标
+ICON_CONFIG = {
+    "历史遗迹": {"color": "red", "icon": "flag"},
+    "历史建筑": {"color": "darkred", "icon": "home"},
+    "观景台": {"color": "blue", "icon": "eye-open"},
+    "主题公园": {"color": "green", "icon": "tree-conifer"},
+    "餐饮": {"color": "orange", "icon": "cutlery"},
+    "自然风光": {"color": "lightgreen", "icon": "picture"},
+    "博物馆": {"color": "purple", "icon": "book"},
+    "其他": {"color": "gray", "icon": "info-sign"}
+}
+
 # 预设景点数据
 PRESET_LOCATIONS = [
     {"name": "澳门大三巴牌坊", "location": [
@@ -66,24 +162,249 @@ PRESET_LOCATIONS = [
 # 数据文件路径
 DATA_FILE = "locations.json"
 
+# 存储方式：json（整体重写JSON文件）、journal（追加写日志）或 sqlite
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+JOURNAL_FILE = os.environ.get('JOURNAL_FILE', 'locations.journal.ndjson')
+SQLITE_FILE = os.environ.get('SQLITE_FILE', 'locations.db')
+
+# Waitress工作线程数（多进程时为每个进程的线程数）
+THREADS = int(os.environ.get('THREADS', 4))
+
+# 工作进程数，大于1时主进程预先fork多个Waitress进程共用监听端口，各进程通过映射文件共享景点数据
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 1))
+SHARED_SNAPSHOT_FILE = os.environ.get('SHARED_SNAPSHOT_FILE', 'locations.snapshot.bin')
+# 存储的跨进程写锁：服务器（单进程或多进程）和命令行导入都在写入、重新加载时持有
+STORE_LOCK_FILE = os.environ.get('STORE_LOCK_FILE', f'{SHARED_SNAPSHOT_FILE}.lock')
+
+# 实时更新（SSE）：单独的端口，默认为主端口+1；经反向代理访问时可用SSE_URL指定完整地址
+LIVE_UPDATES = os.environ.get('LIVE_UPDATES', '1') != '0'
+SSE_PORT = int(os.environ.get('SSE_PORT', int(os.environ.get('PORT', 5000)) + 1))
+SSE_URL = os.environ.get('SSE_URL', '')
+
+# 一次新增的景点超过该数量时（例如批量导入），只通知浏览器重新加载
+LIVE_MAX_BATCH = int(os.environ.get('LIVE_MAX_BATCH', 100))
+
+# 静态发布目录：设置后服务器在数据变化后自动重新发布，读请求可交给nginx等静态服务器
+PUBLISH_DIR = os.environ.get('PUBLISH_DIR', '')
+# 数据变化后等待多少秒再发布，合并短时间内的多次修改
+PUBLISH_DELAY = float(os.environ.get('PUBLISH_DELAY', 2))
+# 静态发布时景点数据按该缩放级别的瓦片分文件，浏览器只读取可见范围内的瓦片；
+# 默认比聚类最大级别小1，刚显示单个景点时一屏通常涉及1~4个文件
+PUBLISH_TILE_ZOOM = os.environ.get('PUBLISH_TILE_ZOOM', '')
+
+
+def create_backend():
+    """根据配置创建存储后端"""
+    if STORAGE_BACKEND == 'journal':
+        return JournalBackend(
+            JOURNAL_FILE,
+            import_path=DATA_FILE,
+            defaults=PRESET_LOCATIONS,
+            compact_bytes=int(os.environ.get(
+                'JOURNAL_COMPACT_BYTES', 4 * 1024 * 1024)),
+            logger=app.logger)
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteBackend(
+            SQLITE_FILE,
+            pool_size=THREADS,
+            import_path=DATA_FILE,
+            defaults=PRESET_LOCATIONS,
+            logger=app.logger)
+    return JsonFileBackend(DATA_FILE, PRESET_LOCATIONS)
+
+
+# 常驻内存的景点数据，文件被外部修改时自动重新加载
+store_lock = FileLock(STORE_LOCK_FILE)
+location_store = LocationStore(
+    create_backend(),
+    check_interval=float(os.environ.get('STORE_CHECK_INTERVAL', 1.0)),
+    commit_window=float(os.environ.get('COMMIT_WINDOW_MS', 5)) / 1000,
+    categories=ICON_CONFIG,
+    logger=app.logger,
+    shared=SharedSnapshot(SHARED_SNAPSHOT_FILE, lock=store_lock) if WEB_WORKERS > 1 else None,
+    lock=store_lock)
+
+# 景点坐标的空间索引，随新增景点增量更新
+spatial_index = GridIndex(
+    cell_size=float(os.environ.get('SPATIAL_CELL_SIZE', 0.02)))
+
+
+def update_spatial_index(snapshot, added):
+    """数据变化时维护空间索引"""
+    if added is None:
+        spatial_index.rebuild((loc["location"] for loc in snapshot), snapshot.version)
+        return
+    start = len(snapshot) - len(added)
+    for offset, loc in enumerate(added):
+        lat, lng = loc["location"]
+        spatial_index.insert(start + offset, lat, lng)
+
+
+location_store.add_listener(update_spatial_index)
+
+# 坐标的NumPy列式副本，用于向量化的距离计算
+coordinate_columns = CoordinateColumns()
+
+
+def update_coordinate_columns(snapshot, added):
+    """数据变化时维护坐标列"""
+    if added is None:
+        coordinate_columns.rebuild((loc["location"] for loc in snapshot), snapshot.version)
+        return
+    for loc in added:
+        coordinate_columns.append(*loc["location"])
+
+
+location_store.add_listener(update_coordinate_columns)
+
+
+def create_cluster_index():
+    """按缩放级别预先聚合的标记聚类"""
+    return ClusterIndex(
+        min_zoom=int(os.environ.get('CLUSTER_MIN_ZOOM', 3)),
+        max_zoom=int(os.environ.get('CLUSTER_MAX_ZOOM', 13)))
+
+
+cluster_index = create_cluster_index()
+
+# 每个类型单独的聚类，按类型筛选时合并查询
+type_clusters = {}
+
+
+def update_cluster_index(snapshot, added):
+    """数据变化时维护聚类"""
+    global type_clusters
+    if added is None:
+        cluster_index.rebuild((loc["location"] for loc in snapshot), snapshot.version)
+        grouped = {}
+        for location_id, loc in enumerate(snapshot):
+            ids, points = grouped.setdefault(loc["type"], ([], []))
+            ids.append(location_id)
+            points.append(loc["location"])
+        fresh = {}
+        for type_name, (ids, points) in grouped.items():
+            fresh[type_name] = create_cluster_index()
+            fresh[type_name].rebuild(points, snapshot.version, ids)
+        type_clusters = fresh
+        return
+    start = len(snapshot) - len(added)
+    for offset, loc in enumerate(added):
+        lat, lng = loc["location"]
+        cluster_index.insert(start + offset, lat, lng)
+        index = type_clusters.get(loc["type"])
+        if index is None:
+            index = type_clusters[loc["type"]] = create_cluster_index()
+        index.insert(start + offset, lat, lng)
+
+
+location_store.add_listener(update_cluster_index)
+
+# 每个类型的景点编号列表，用于按类型筛选和统计数量
+type_index = TypeIndex()
+
+
+def update_type_index(snapshot, added):
+    """数据变化时维护类型索引"""
+    if added is None:
+        type_index.rebuild((loc["type"] for loc in snapshot), snapshot.version)
+        return
+    start = len(snapshot) - len(added)
+    for offset, loc in enumerate(added):
+        type_index.insert(start + offset, loc["type"])
+
+
+location_store.add_listener(update_type_index)
+
+# 名称和描述的全文索引，随新增景点增量更新
+search_index = SearchIndex()
+
+
+def update_search_index(snapshot, added):
+    """数据变化时维护全文索引"""
+    if added is None:
+        search_index.rebuild(
+            ((loc["name"], loc.get("description", ""), loc["type"]) for loc in snapshot),
+            snapshot.version)
+        return
+    start = len(snapshot) - len(added)
+    for offset, loc in enumerate(added):
+        search_index.insert(start + offset, loc["name"], loc.get("description", ""), loc["type"])
+
+
+location_store.add_listener(update_search_index)
+
+# 推送新增景点的SSE服务，在run_server中启动
+live_events = EventBroker(
+    history=int(os.environ.get('SSE_HISTORY', 256)),
+    max_clients=int(os.environ.get('SSE_MAX_CLIENTS', 10000)),
+    logger=app.logger)
+
+
+def publish_live_update(snapshot, added):
+    """把新增景点推送给正在浏览的页面"""
+    if added is None or len(added) > LIVE_MAX_BATCH:
+        live_events.publish('reload', {"version": snapshot.version})
+        return
+    start = len(snapshot) - len(added)
+    live_events.publish('locations', {
+        "version": snapshot.version,
+        "features": [to_feature(loc, start + offset) for offset, loc in enumerate(added)],
+    })
+
+
+location_store.add_listener(publish_live_update)
+
+# 渲染好的主页面缓存
+render_cache = VersionedCache(
+    maxsize=int(os.environ.get('RENDER_CACHE_SIZE', 8)))
+
+# 行程规划的距离矩阵缓存，同一组景点的多次规划共用
+distance_cache = VersionedCache(
+    maxsize=int(os.environ.get('DISTANCE_CACHE_SIZE', 16)))
+
+# 运行指标，在 /metrics 以Prometheus文本格式导出
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', '请求处理耗时', ('route', 'method'))
+REQUEST_TOTAL = metrics.counter(
+    'http_requests_total', '请求数', ('route', 'method', 'status'))
+STAGE_SECONDS = metrics.histogram(
+    'stage_duration_seconds', '各处理阶段耗时', ('stage',))
+PAGE_BYTES = metrics.gauge(
+    'page_bytes', '最近生成的主页面大小', ('mode', 'encoding'))
+metrics.gauge('locations', '景点数量',
+              callback=lambda: {(): len(location_store.snapshot())})
+metrics.gauge('data_version', '数据版本号',
+              callback=lambda: {(): location_store.version})
+CACHES = {'render': render_cache, 'distance': distance_cache}
+metrics.counter('cache_hits_total', '缓存命中数', ('cache',),
+                callback=lambda: {(name,): c.stats()['hits'] for name, c in CACHES.items()})
+metrics.counter('cache_misses_total', '缓存未命中数', ('cache',),
+                callback=lambda: {(name,): c.stats()['misses'] for name, c in CACHES.items()})
+metrics.gauge('cache_hit_ratio', '缓存命中率', ('cache',),
+              callback=lambda: {(name,): c.stats()['hit_ratio'] for name, c in CACHES.items()})
+metrics.gauge('sse_clients', '实时更新的连接数',
+              callback=lambda: {(): live_events.client_count()})
+
+# 请求抽样性能分析，可通过 /admin/profiler 在运行中开关
+profiler = RequestProfiler(
+    os.path.join('logs', 'profiles'),
+    rate=PROFILE_RATE,
+    mode=PROFILE_MODE,
+    logger=app.logger)
+
 
 def load_locations():
-    """从文件加载景点数据"""
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return PRESET_LOCATIONS
-    except Exception as e:
-        app.logger.error(f"加载位置数据错误: {e}")
-        return PRESET_LOCATIONS
+    """获取景点数据的只读快照"""
+    with STAGE_SECONDS.time('load_locations'):
+        return location_store.snapshot()
 
 
 def save_locations(locations):
     """保存景点数据到文件"""
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(locations, f, ensure_ascii=False, indent=4)
+        with STAGE_SECONDS.time('save_locations'):
+            location_store.replace(locations)
         app.logger.info("位置数据保存成功")
     except Exception as e:
         app.logger.error(f"保存位置数据错误: {e}")
@@ -96,29 +417,10 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
     <title>澳门与广东旅游景点地图</title>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: 'Arial', sans-serif; background: #f0f2f5; }
-        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 1rem; text-align: center; }
-        .header h1 { margin-bottom: 0.5rem; }
-        .container { display: flex; flex-direction: column; height: calc(100vh - 80px); }
-        @media (min-width: 768px) { .container { flex-direction: row; } }
-        .map-container { flex: 1; min-height: 400px; }
-        .sidebar { background: white; padding: 1.5rem; box-shadow: -2px 0 10px rgba(0,0,0,0.1); width: 100%; }
-        @media (min-width: 768px) { .sidebar { width: 400px; } }
-        .form-group { margin-bottom: 1rem; }
-        label { display: block; margin-bottom: 0.5rem; font-weight: 600; color: #333; }
-        input, select, textarea { width: 100%; padding: 0.75rem; border: 2px solid #e1e5e9; border-radius: 8px; font-size: 14px; }
-        input:focus, select:focus, textarea:focus { outline: none; border-color: #667eea; }
-        button { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; padding: 1rem; border-radius: 8px; cursor: pointer; width: 100%; font-size: 16px; font-weight: 600; }
-        button:hover { opacity: 0.9; }
-        .message { padding: 1rem; border-radius: 8px; margin-top: 1rem; }
-        .success { color: #28a745; background: #d4edda; border: 1px solid #c3e6cb; }
-        .error { color: #dc3545; background: #f8d7da; border: 1px solid #f5c6cb; }
-        .info { color: #17a2b8; background: #d1ecf1; border: 1px solid #bee5eb; }
-    </style>
+    <link rel="stylesheet" href="{{ static_urls['style.css'] }}">
+    <script src="{{ static_urls['app.js'] }}" defer></script>
 </head>
-<body>
+<body data-live-url="{{ live_url }}" data-live-port="{{ live_port }}">
     <div class="header">
         <h1>澳门与广东旅游景点地图</h1>
         <p>探索发现粤港澳大湾区的美丽景点</p>
@@ -126,12 +428,19 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
     
     <div class="container">
         <div class="map-container" id="map-container">
+            {% if map_html %}
             {{ map_html | safe }}
+            {% else %}
+            <div class="panel">
+                <h2>{{ panel_title }}</h2>
+                {% if panel_detail %}<p>{{ panel_detail }}</p>{% endif %}
+            </div>
+            {% endif %}
         </div>
         
         <div class="sidebar">
             <h2>🗺️ 添加新景点</h2>
-            <form action="/add_location" method="post" onsubmit="return validateForm()">
+            <form action="/add_location" method="post">
                 <div class="form-group">
                     <label for="name">🏷️ 景点名称:</label>
                     <input type="text" id="name" name="name" required placeholder="请输入景点名称">
@@ -170,6 +479,18 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 <button type="submit">✅ 添加景点</button>
             </form>
             
+            <div id="form-message" class="message" hidden></div>
+
+            {% if facets %}
+            <div class="facets">
+                <h3>🔎 按类型筛选</h3>
+                <a href="/"{% if not selected_types %} class="active"{% endif %}>全部</a>
+                {% for type_name, count in facets %}
+                <a href="/?types={{ type_name | urlencode }}"{% if type_name in selected_types %} class="active"{% endif %}>{{ type_name }} ({{ count }})</a>
+                {% endfor %}
+            </div>
+            {% endif %}
+
             <div class="message info">
                 <strong>💡 使用提示:</strong>
                 <p>1. 在地图上点击可以获取坐标</p>
@@ -185,70 +506,319 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         </div>
     </div>
 
-    <script>
-        function validateForm() {
-            const lat = parseFloat(document.getElementById('lat').value);
-            const lng = parseFloat(document.getElementById('lng').value);
-            
-            if (lat < 20 || lat > 25 || lng < 110 || lng > 117) {
-                alert('请输入有效的澳门/广东地区坐标（纬度20-25，经度110-117）');
-                return false;
-            }
-            return true;
-        }
-        
-        document.addEventListener('DOMContentLoaded', function() {
-            document.getElementById('name').focus();
-        });
-    </script>
 </body>
 </html>'''
 
 
+def build_static_urls(*filenames):
+    """静态文件的URL，附带内容哈希，文件内容变化后URL随之变化"""
+    urls = {}
+    for filename in filenames:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:12]
+        urls[filename] = f"{app.static_url_path}/{filename}?v={digest}"
+    return urls
+
+
+STATIC_URLS = build_static_urls('style.css', 'app.js')
+
+# 页面模板在启动时编译一次，之后每次只渲染
+PAGE_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+
+def render_page(map_html=None, panel_title=None, panel_detail=None, message=None, message_type=None,
+                facets=None, selected_types=(), static_urls=None):
+    """渲染页面；没有地图时在地图区域显示panel_title提示"""
+    return PAGE_TEMPLATE.render(
+        facets=facets,
+        selected_types=selected_types,
+        static_urls=static_urls or STATIC_URLS,
+        live_url=SSE_URL if LIVE_UPDATES else '',
+        live_port=SSE_PORT if LIVE_UPDATES else '',
+        map_html=map_html,
+        panel_title=panel_title,
+        panel_detail=panel_detail,
+        message=message,
+        message_type=message_type)
+
+
+def create_map():
+    """创建底图"""
+    return folium.Map(
+        location=INITIAL_CENTER,
+        zoom_start=INITIAL_ZOOM,
+        tiles='OpenStreetMap',
+        attr='© OpenStreetMap contributors'
+    )
+
+
+def type_order(type_name):
+    """类型的显示顺序：先按ICON_CONFIG中的顺序，其余按名称"""
+    keys = list(ICON_CONFIG)
+    return (keys.index(type_name) if type_name in ICON_CONFIG else len(keys), type_name)
+
+
+def build_map_html(locations, ids=None, types=None):
+    """生成folium地图的HTML，ids为要显示的景点编号，默认全部"""
+    start = time.perf_counter()
+    # 创建地图
+    m = create_map()
+
+    # 每个类型一个图层，可在图层控件中单独显示或隐藏
+    groups = {}
+    counts = {}
+
+    # 添加标记，弹窗内容在点击时才从接口加载
+    for location_id in (range(len(locations)) if ids is None else ids):
+        loc = locations[location_id]
+        type_name = loc["type"]
+        group = groups.get(type_name)
+        if group is None:
+            group = groups[type_name] = folium.FeatureGroup(name=type_name)
+            counts[type_name] = 0
+        counts[type_name] += 1
+        config = ICON_CONFIG.get(type_name, ICON_CONFIG["其他"])
+
+        folium.Marker(
+            location=loc["location"],
+            tooltip=loc["name"],
+            icon=folium.Icon(color=config["color"], icon=config["icon"]),
+            location_id=location_id
+        ).add_to(group)
+
+    for type_name in sorted(groups, key=type_order):
+        groups[type_name].layer_name = f"{type_name} ({counts[type_name]})"
+        m.add_child(groups[type_name])
+
+    m.add_child(LazyPopups('/api/locations/'))
+
+    # 添加点击获取坐标的功能
+    m.add_child(folium.LatLngPopup())
+    m.add_child(LiveMarkerLayer(ICON_CONFIG, known_count=len(locations), groups=groups, types=types))
+    if groups:
+        m.add_child(folium.LayerControl(collapsed=False))
+    STAGE_SECONDS.observe(time.perf_counter() - start, 'folium_build')
+
+    with STAGE_SECONDS.time('repr_html'):
+        return m._repr_html_()
+
+
+def build_api_map_html(types=None):
+    """生成不含标记的地图，标记由浏览器按可见范围从接口加载"""
+    with STAGE_SECONDS.time('folium_build'):
+        m = create_map()
+        m.add_child(ApiMarkerLoader('/api/clusters', ICON_CONFIG, types))
+        m.add_child(folium.LatLngPopup())
+        m.add_child(LiveMarkerLayer(ICON_CONFIG))
+    with STAGE_SECONDS.time('repr_html'):
+        return m._repr_html_()
+
+
+def facet_counts(locations):
+    """各类型的景点数，按显示顺序排列"""
+    if type_index.base_version <= locations.version:
+        counts = type_index.counts(len(locations))
+    else:
+        counts = {}
+        for loc in locations:
+            counts[loc["type"]] = counts.get(loc["type"], 0) + 1
+    return sorted(((name, n) for name, n in counts.items() if n), key=lambda item: type_order(item[0]))
+
+
+def published_clusters(snapshot):
+    """静态发布用的各缩放级别全部聚类，单个景点附带类型和名称"""
+    index = cluster_index
+    if index.base_version > snapshot.version:
+        index = create_cluster_index()
+        index.rebuild(loc["location"] for loc in snapshot)
+    count = len(snapshot)
+    result = {}
+    for zoom in range(index.min_zoom, index.max_zoom + 1):
+        items = []
+        for n, lat, lng, extra in index.clusters(-90, -180, 90, 180, zoom):
+            if n > 1:
+                items.append([n, round(lat, 6), round(lng, 6), extra])
+            elif extra < count:
+                loc = snapshot[extra]
+                items.append([1, round(lat, 6), round(lng, 6), extra, loc["type"], loc["name"]])
+        # 固定顺序，内容相同时文件哈希也相同
+        items.sort()
+        result[zoom] = items
+    return result
+
+
+def render_published_page(static_urls, manifest):
+    """静态发布的主页面，标记从发布目录中的数据文件加载"""
+    m = create_map()
+    m.add_child(StaticDataLoader(manifest, ICON_CONFIG))
+    m.add_child(folium.LatLngPopup())
+    m.add_child(LiveMarkerLayer(ICON_CONFIG, known_count=manifest["count"]))
+    # 静态页面没有按类型筛选的链接
+    return render_page(map_html=m._repr_html_(), static_urls=static_urls)
+
+
+def render_index_page(locations, mode, types=None, ids=None):
+    """渲染完整的主页面，types为筛选的类型，ids为对应的景点编号"""
+    if mode == 'api':
+        map_html = build_api_map_html(types)
+    else:
+        map_html = build_map_html(locations, ids, types)
+    return render_page(map_html=map_html, facets=facet_counts(locations),
+                       selected_types=types or ())
+
+
+def build_index_page(locations, mode, key, types=None, ids=None):
+    """生成并压缩主页面，记录各种编码的大小
+
+    folium生成的元素编号是随机的，ETag按数据和页面的缓存键计算，
+    同一份数据重新渲染或由其他工作进程渲染时ETag不变。
+    """
+    tag = f"{PAGE_ETAG_SEED}:{locations.generation}:{len(locations)}:{key}"
+    page = CompressedPage(render_index_page(locations, mode, types, ids),
+                          etag=hashlib.sha1(tag.encode('utf-8')).hexdigest())
+    PAGE_BYTES.set(len(page.body), mode, 'identity')
+    for encoding, data in page.encodings.items():
+        PAGE_BYTES.set(len(data), mode, encoding)
+    return page
+
+
+def send_page(page, cache_control=None):
+    """发送预压缩的页面，支持If-None-Match条件请求"""
+    if page.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        encoding, body = page.select(request.accept_encodings)
+        response = Response(body, mimetype=page.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(page.etag)
+    response.headers['Cache-Control'] = cache_control or PAGE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/')
 def index():
     """主页面"""
     try:
         locations = load_locations()
+        mode = request.args.get('mode', MAP_MODE)
+        if mode not in ('static', 'api'):
+            mode = MAP_MODE
 
-        # 创建地图
-        m = folium.Map(
-            location=INITIAL_CENTER,
-            zoom_start=INITIAL_ZOOM,
-            tiles='OpenStreetMap',
-            attr='© OpenStreetMap contributors'
-        )
+        # 按类型筛选时只生成所选类型的标记
+        types = known_types(request.args.get('types'))
+        ids = query_ids(locations, types=types) if types else None
+        if (len(locations) if ids is None else len(ids)) > STATIC_MARKER_LIMIT:
+            mode = 'api'
 
-        # 添加标记
-        for loc in locations:
-            icon_config = {
-                "历史遗迹": {"color": "red", "icon": "flag"},
-                "历史建筑": {"color": "darkred", "icon": "home"},
-                "观景台": {"color": "blue", "icon": "eye-open"},
-                "主题公园": {"color": "green", "icon": "tree-conifer"},
-                "餐饮": {"color": "orange", "icon": "cutlery"},
-                "自然风光": {"color": "lightgreen", "icon": "picture"},
-                "博物馆": {"color": "purple", "icon": "book"},
-                "其他": {"color": "gray", "icon": "info-sign"}
-            }
-
-            config = icon_config.get(loc["type"], icon_config["其他"])
-
-            folium.Marker(
-                location=loc["location"],
-                popup=f"<b>{loc['name']}</b><br>类型: {loc['type']}<br>描述: {loc['description']}",
-                tooltip=loc["name"],
-                icon=folium.Icon(color=config["color"], icon=config["icon"])
-            ).add_to(m)
-
-        # 添加点击获取坐标的功能
-        m.add_child(folium.LatLngPopup())
-
-        return render_template_string(HTML_TEMPLATE, map_html=m._repr_html_())
+        # 数据未变化时直接返回缓存的页面
+        key = f'index-{mode}' + (f'-{",".join(sorted(types))}' if types else '')
+        page = render_cache.get_or_create(
+            locations.version, key,
+            lambda: build_index_page(locations, mode, key, types, ids))
+        return send_page(page)
 
     except Exception as e:
         app.logger.error(f"地图生成错误: {e}")
-        return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>地图加载失败</h2><p>请刷新页面重试</p></div>'))
+        return render_page(panel_title="地图加载失败", panel_detail="请刷新页面重试")
+
+
+def query_bbox(locations, bbox):
+    """范围内的景点编号，优先使用空间索引"""
+    if bbox is None:
+        return range(len(locations))
+    if spatial_index.base_version <= locations.version:
+        # 索引可能比快照多出刚提交的景点，超出快照的编号要去掉
+        count = len(locations)
+        return [i for i in spatial_index.bbox(*bbox) if i < count]
+    # 快照早于索引最近一次重建，编号已不对应，退回线性扫描
+    return [i for i, loc in enumerate(locations) if in_bbox(loc, bbox)]
+
+
+def parse_types(value):
+    """逗号分隔的类型列表"""
+    return set(filter(None, (value or '').split(',')))
+
+
+def known_types(value):
+    """逗号分隔的类型列表中已知的类型，用于页面筛选，避免任意参数占满页面缓存"""
+    return {t for t in parse_types(value) if t in ICON_CONFIG or t in type_index}
+
+
+def query_ids(locations, bbox=None, types=None):
+    """按范围和类型筛选景点编号，只按类型筛选时直接取类型索引"""
+    if types and bbox is None and type_index.base_version <= locations.version:
+        return type_index.ids(types, len(locations))
+    ids = query_bbox(locations, bbox)
+    if types:
+        ids = [i for i in ids if locations[i]["type"] in types]
+    return ids
+
+
+def api_error(message, status=400):
+    """接口错误响应"""
+    return jsonify({"error": message}), status
+
+
+@app.route('/api/locations')
+def api_locations():
+    """按范围和类型查询景点，默认返回GeoJSON
+
+    参数: bbox=西,南,东,北  type=类型（可用逗号分隔多个）
+          format=geojson|json  limit=最大返回数量
+    """
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        limit = min(int(request.args.get('limit', API_MAX_RESULTS)), API_MAX_RESULTS)
+    except ValueError as e:
+        return api_error(f"参数错误: {e}")
+    if limit < 0:
+        return api_error("参数错误: limit 不能为负数")
+    types = parse_types(request.args.get('type'))
+    output = request.args.get('format', 'geojson')
+
+    locations = load_locations()
+    ids = query_ids(locations, bbox, types)
+    total = len(ids)
+    matched = [(location_id, locations[location_id]) for location_id in ids[:limit]]
+
+    if output == 'json':
+        return jsonify({
+            "version": locations.version,
+            "total": total,
+            "locations": [to_record(loc, i) for i, loc in matched],
+        })
+    return jsonify({
+        "type": "FeatureCollection",
+        "version": locations.version,
+        "total": total,
+        "features": [to_feature(loc, i) for i, loc in matched],
+    })
+
+
+def wants_json():
+    """请求方（页面脚本）是否希望得到JSON响应"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+
+def form_error(panel_title, message, status=400):
+    """表单提交失败的响应"""
+    if wants_json():
+        return api_error(message, status)
+    return render_page(panel_title=panel_title, message=message, message_type="error")
+
+
+@app.route('/api/locations/<int:location_id>')
+def api_location_detail(location_id):
+    """单个景点的详情，供地图标记的弹窗按需加载"""
+    locations = load_locations()
+    if location_id >= len(locations):
+        return api_error("景点不存在", 404)
+    response = jsonify(to_record(locations[location_id], location_id))
+    response.headers['Cache-Control'] = DETAIL_CACHE_CONTROL
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 @app.route('/add_location', methods=['POST'])
@@ -263,20 +833,17 @@ def add_location():
 
         # 验证输入
         if not all([name, lat_str, lng_str, location_type]):
-            return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>请填写完整信息</h2></div>'),
-                                          message="错误：请填写所有必填字段", message_type="error")
+            return form_error("请填写完整信息", "错误：请填写所有必填字段")
 
         try:
             lat = float(lat_str)
             lng = float(lng_str)
         except ValueError:
-            return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>坐标格式错误</h2></div>'),
-                                          message="错误：请输入有效的经纬度坐标", message_type="error")
+            return form_error("坐标格式错误", "错误：请输入有效的经纬度坐标")
 
         # 验证坐标范围
         if not (20 <= lat <= 25 and 110 <= lng <= 117):
-            return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>坐标超出范围</h2></div>'),
-                                          message="错误：坐标不在广东/澳门范围内", message_type="error")
+            return form_error("坐标超出范围", "错误：坐标不在广东/澳门范围内")
 
         new_location = {
             "name": name,
@@ -285,32 +852,525 @@ def add_location():
             "description": description
         }
 
-        locations = load_locations()
-        locations.append(new_location)
-        save_locations(locations)
+        with STAGE_SECONDS.time('save_locations'):
+            snapshot = location_store.append(new_location)
 
         app.logger.info(f"新景点添加成功: {name}")
 
+        # 页面脚本提交时不刷新页面，新标记通过实时更新加到地图上
+        if wants_json():
+            return jsonify({"message": "景点添加成功！", "version": snapshot.version})
+
         # 重定向回主页
         return '''<script>alert("景点添加成功！"); window.location.href = "/";</script>'''
 
     except Exception as e:
         app.logger.error(f"添加景点错误: {e}")
-        return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>添加失败</h2></div>'),
-                                      message=f"错误: {str(e)}", message_type="error")
+        return form_error("添加失败", f"错误: {str(e)}", 500)
+
+
+@app.route('/api/search')
+def api_search():
+    """按名称和描述搜索景点，结果按相关程度排序
+
+    参数: q=关键词（空格分隔多个词时需全部包含）  type=类型（可用逗号分隔多个）
+          limit=最大返回数量
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return api_error("缺少参数q")
+    try:
+        limit = min(int(request.args.get('limit', 20)), API_MAX_RESULTS)
+    except ValueError as e:
+        return api_error(f"参数错误: {e}")
+    if limit < 0:
+        return api_error("参数错误: limit 不能为负数")
+    types = parse_types(request.args.get('type'))
+
+    locations = load_locations()
+    if search_index.base_version <= locations.version:
+        total, matches = search_index.search(query, types, limit, count=len(locations))
+    else:
+        # 快照早于索引最近一次重建，编号已不对应，退回逐个比较
+        total, matches = linear_search(locations, query, types, limit)
+
+    results = []
+    for score, location_id in matches:
+        record = to_record(locations[location_id], location_id)
+        record["score"] = score
+        results.append(record)
+    return jsonify({
+        "version": locations.version,
+        "query": query,
+        "total": total,
+        "results": results,
+    })
+
+
+@app.route('/api/nearby')
+def api_nearby():
+    """附近的景点，按距离排序
+
+    参数: lat, lng 中心坐标（或 id=景点编号，以该景点为中心）
+          radius=半径（米）  k=最多返回几个最近的景点  type=类型（可用逗号分隔多个）
+    """
+    locations = load_locations()
+    try:
+        if request.args.get('id'):
+            center_id = int(request.args['id'])
+            if not 0 <= center_id < len(locations):
+                return api_error("景点不存在", 404)
+            lat, lng = locations[center_id]["location"]
+        else:
+            lat = float(request.args['lat'])
+            lng = float(request.args['lng'])
+        radius = float(request.args['radius']) if request.args.get('radius') else None
+        k = int(request.args['k']) if request.args.get('k') else None
+    except (KeyError, ValueError):
+        return api_error("参数错误: 需要 lat、lng（或 id），以及 radius 或 k")
+    # 比较运算对nan总为False，这里同时拒绝nan和无穷大
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return api_error("参数错误: lat 需在 -90~90 之间，lng 需在 -180~180 之间")
+    if radius is None and k is None:
+        return api_error("参数错误: 需要 radius 或 k")
+    if (radius is not None and not radius >= 0) or (k is not None and k < 0):
+        return api_error("参数错误: radius 和 k 不能为负数")
+    types = parse_types(request.args.get('type'))
+    limit = min(k if k is not None else API_MAX_RESULTS, API_MAX_RESULTS)
+
+    count = len(locations)
+    candidates = None
+    if k is not None and not types and spatial_index.base_version <= locations.version:
+        # 最近邻查询走空间索引，只检查附近几圈网格
+        extra = max(0, len(spatial_index) - count)
+        nearest = spatial_index.nearest(lat, lng, limit + extra, radius)
+        # 查询点离数据太远、需要扩展的圈数过多时返回None，改用坐标列逐点计算
+        if nearest is not None:
+            candidates = [(i, d) for d, i in nearest if i < count]
+    if candidates is not None:
+        # 空间索引已给出结果
+        pass
+    elif coordinate_columns.base_version <= locations.version:
+        ids, dist = coordinate_columns.nearby(lat, lng, radius=radius, k=limit, count=count)
+        if types:
+            # 有类型过滤时逐步扩大候选数量，直到过滤后足够或已取完
+            want = limit
+            while want < count and sum(1 for i in ids.tolist()
+                                       if locations[i]["type"] in types) < limit:
+                want *= 4
+                ids, dist = coordinate_columns.nearby(lat, lng, radius=radius, k=want, count=count)
+        candidates = zip(ids.tolist(), dist.tolist())
+    else:
+        # 快照早于坐标列最近一次重建，逐个计算
+        candidates = [(i, haversine_m(lat, lng, *loc["location"]))
+                      for i, loc in enumerate(locations)]
+        candidates = sorted(((i, d) for i, d in candidates if radius is None or d <= radius),
+                            key=lambda item: (item[1], item[0]))
+
+    results = []
+    for location_id, distance in candidates:
+        loc = locations[location_id]
+        if types and loc["type"] not in types:
+            continue
+        record = to_record(loc, location_id)
+        record["distance_m"] = round(distance, 1)
+        results.append(record)
+        if len(results) >= limit:
+            break
+
+    return jsonify({
+        "version": locations.version,
+        "center": [lat, lng],
+        "results": results,
+    })
+
+
+@app.route('/api/clusters')
+def api_clusters():
+    """按缩放级别返回范围内的聚类（GeoJSON）
+
+    参数: bbox=西,南,东,北  zoom=缩放级别  type=类型（可用逗号分隔多个）
+    聚类的properties中cluster为true，point_count为数量，expansion_zoom为展开级别。
+    """
+    try:
+        bbox = parse_bbox(request.args.get('bbox', '-180,-85,180,85'))
+        zoom = int(request.args.get('zoom', INITIAL_ZOOM))
+    except ValueError as e:
+        return api_error(f"参数错误: {e}")
+    types = parse_types(request.args.get('type'))
+
+    locations = load_locations()
+    count = len(locations)
+    if types:
+        # 合并所选类型各自的聚类
+        clusters_by_type = type_clusters
+        indexes = [clusters_by_type[t] for t in sorted(types) if t in clusters_by_type]
+    else:
+        indexes = [cluster_index]
+    clusters = None
+    if not indexes:
+        clusters = []
+    elif all(index.base_version <= locations.version for index in indexes):
+        clusters = merged_clusters(indexes, *bbox, zoom)
+
+    features = []
+    if clusters is None:
+        # 已放大到单个景点级别，或聚类尚未包含该快照
+        for location_id in query_ids(locations, bbox, types)[:API_MAX_RESULTS]:
+            features.append(to_feature(locations[location_id], location_id))
+    else:
+        for n, lat, lng, extra in clusters:
+            if n == 1:
+                if extra < count:
+                    features.append(to_feature(locations[extra], extra))
+                continue
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lng, lat]},
+                "properties": {"cluster": True, "point_count": n, "expansion_zoom": extra},
+            })
+
+    return jsonify({
+        "type": "FeatureCollection",
+        "version": locations.version,
+        "zoom": zoom,
+        "features": features,
+    })
+
+
+def parse_itinerary(locations):
+    """读取行程参数，返回 (景点编号列表, 起点编号, 是否回到起点)，参数错误时抛出ValueError
+
+    参数可以在查询字符串或表单中: ids=编号（逗号分隔） start=起点编号（默认第一个） loop=1 回到起点
+    """
+    ids = []
+    for value in request.values.get('ids', '').split(','):
+        if value.strip():
+            location_id = int(value)
+            if not 0 <= location_id < len(locations):
+                raise ValueError(f"景点 {location_id} 不存在")
+            ids.append(location_id)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) < 2:
+        raise ValueError("至少需要选择2个景点")
+    if len(ids) > ITINERARY_MAX_STOPS:
+        raise ValueError(f"最多选择 {ITINERARY_MAX_STOPS} 个景点")
+    start = int(request.values['start']) if request.values.get('start') else ids[0]
+    if start not in ids:
+        raise ValueError("起点必须是选择的景点之一")
+    return ids, start, request.values.get('loop') in ('1', 'true')
+
+
+def distance_matrix(locations, ids):
+    """ids两两之间的距离矩阵，按数据版本和景点集合缓存"""
+    key = 'distance-' + hashlib.sha1(','.join(map(str, ids)).encode()).hexdigest()
+
+    def build():
+        with STAGE_SECONDS.time('distance_matrix'):
+            points = [locations[location_id]["location"] for location_id in ids]
+            return haversine_matrix([p[0] for p in points], [p[1] for p in points])
+
+    return distance_cache.get_or_create(locations.version, key, build)
+
+
+def plan_itinerary(locations, ids, start, loop=False):
+    """规划经过ids中所有景点的顺序，返回接口的结果"""
+    # 同一组景点不论选择顺序都使用同一个距离矩阵
+    ids = sorted(ids)
+    dist = distance_matrix(locations, ids)
+    with STAGE_SECONDS.time('itinerary_solve'):
+        order, total = plan_route(dist, ids.index(start), loop, ITINERARY_TIME_BUDGET_MS / 1000)
+
+    stops = []
+    for step, index in enumerate(order):
+        loc = locations[ids[index]]
+        stops.append({
+            "id": ids[index],
+            "name": loc["name"],
+            "type": loc["type"],
+            "location": list(loc["location"]),
+            "leg_m": round(float(dist[order[step - 1], index]), 1) if step else 0.0,
+        })
+    coordinates = [[lng, lat] for lat, lng in (stop["location"] for stop in stops)]
+    if loop:
+        coordinates.append(coordinates[0])
+    return {
+        "version": locations.version,
+        "loop": loop,
+        "distance_m": round(total, 1),
+        "stops": stops,
+        "route": {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "properties": {"distance_m": round(total, 1)},
+        },
+    }
+
+
+@app.route('/api/itinerary', methods=['GET', 'POST'])
+def api_itinerary():
+    """行程规划：给出经过所选景点的游览顺序和总距离
+
+    参数见parse_itinerary。返回各景点（含与上一站的距离leg_m）和路线（GeoJSON LineString）。
+    """
+    locations = load_locations()
+    try:
+        ids, start, loop = parse_itinerary(locations)
+    except ValueError as e:
+        return api_error(f"参数错误: {e}")
+    return jsonify(plan_itinerary(locations, ids, start, loop))
+
+
+def build_itinerary_map_html(itinerary):
+    """在地图上按顺序标出各景点并连线"""
+    m = create_map()
+    points = [stop["location"] for stop in itinerary["stops"]]
+    folium.PolyLine(
+        [[lat, lng] for lng, lat in itinerary["route"]["geometry"]["coordinates"]],
+        color='#667eea', weight=4, opacity=0.8,
+        tooltip=f"总距离 {itinerary['distance_m'] / 1000:.1f} 公里"
+    ).add_to(m)
+    for step, stop in enumerate(itinerary["stops"], 1):
+        folium.Marker(
+            location=stop["location"],
+            tooltip=f"{step}. {stop['name']}",
+            icon=folium.DivIcon(
+                icon_size=(26, 26), icon_anchor=(13, 13),
+                html=(f'<div style="width:26px;height:26px;line-height:26px;border-radius:50%;'
+                      f'background:#667eea;color:white;text-align:center;font:bold 12px Arial;">'
+                      f'{step}</div>')),
+            location_id=stop["id"]
+        ).add_to(m)
+    m.add_child(LazyPopups('/api/locations/'))
+    m.fit_bounds([[min(p[0] for p in points), min(p[1] for p in points)],
+                  [max(p[0] for p in points), max(p[1] for p in points)]])
+    return m._repr_html_()
+
+
+@app.route('/itinerary')
+def itinerary_page():
+    """行程规划结果页面，参数同 /api/itinerary"""
+    locations = load_locations()
+    try:
+        ids, start, loop = parse_itinerary(locations)
+    except ValueError as e:
+        return render_page(panel_title="无法规划行程", panel_detail=str(e)), 400
+    itinerary = plan_itinerary(locations, ids, start, loop)
+    return render_page(
+        map_html=build_itinerary_map_html(itinerary),
+        message=f"共 {len(ids)} 个景点，总距离 {itinerary['distance_m'] / 1000:.1f} 公里",
+        message_type="success")
+
+
+@app.route('/api/stats')
+def stats():
+    """运行状态统计"""
+    locations = load_locations()
+    return jsonify({
+        "data_version": locations.version,
+        "locations": len(locations),
+        "types": dict(facet_counts(locations)),
+        "render_cache": render_cache.stats(),
+    })
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus文本格式的运行指标"""
+    return Response(metrics.render(), mimetype=Registry.CONTENT_TYPE)
+
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """查看或修改请求抽样分析
+
+    POST参数: rate=抽样比例(0-1)  mode=sample|cprofile
+              action=flush（立即写出结果）|reset（清空结果）
+    需要设置ADMIN_TOKEN并带正确的X-Admin-Token头，否则返回403。
+    """
+    error = admin_error()
+    if error:
+        return error
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or request.values
+        try:
+            profiler.configure(params.get('rate'), params.get('mode'))
+        except ValueError as e:
+            return api_error(f"参数错误: {e}")
+        action = params.get('action')
+        if action == 'flush':
+            return jsonify({**profiler.status(), "written": profiler.flush()})
+        if action == 'reset':
+            profiler.reset()
+        app.logger.info(f"请求分析设置: rate={profiler.rate} mode={profiler.mode}")
+    return jsonify(profiler.status())
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    if profiler.rate > 0:
+        g.profile = profiler.begin(request.url_rule.rule if request.url_rule else 'unmatched')
+
+
+@app.teardown_request
+def finish_profile(error=None):
+    token = g.pop('profile', None)
+    if token is not None:
+        profiler.end(token)
+
+
+@app.after_request
+def record_request(response):
+    """记录每个路由的请求数和耗时"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        duration = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(duration, route, request.method)
+        REQUEST_TOTAL.inc(route, request.method, str(response.status_code))
+        response.headers['X-Request-ID'] = g.request_id
+        if ACCESS_LOG:
+            access_logger.info("request", extra={"fields": {
+                "request_id": g.request_id,
+                "method": request.method,
+                "path": request.full_path.rstrip('?'),
+                "route": route,
+                "status": response.status_code,
+                "bytes": response.content_length,
+                "duration_ms": round(duration * 1000, 3),
+                "remote_addr": request.remote_addr,
+            }})
+    return response
 
 
 @app.errorhandler(404)
 def not_found_error(error):
-    return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>页面未找到</h2></div>'),
-                                  message="页面不存在", message_type="error"), 404
+    return render_page(panel_title="页面未找到", message="页面不存在", message_type="error"), 404
 
 
 @app.errorhandler(500)
 def internal_error(error):
     app.logger.error(f"服务器错误: {error}")
-    return render_template_string(HTML_TEMPLATE.replace('{{ map_html | safe }}', '<div style="padding: 2rem;"><h2>服务器错误</h2></div>'),
-                                  message="服务器内部错误，请稍后重试", message_type="error"), 500
+    return render_page(panel_title="服务器错误", message="服务器内部错误，请稍后重试", message_type="error"), 500
+
+
+def import_locations(stream, fmt):
+    """流式导入景点，全部校验完成后一次提交，返回导入结果"""
+    report = ImportReport()
+    batches = iter_valid_batches(stream, fmt, ICON_CONFIG, report, IMPORT_BATCH_SIZE)
+    location_store.import_batches(batches)
+    app.logger.info(f"批量导入完成: 成功 {report.accepted} 条，失败 {report.rejected} 条")
+    return report
+
+
+def is_admin():
+    """请求是否带了正确的X-Admin-Token头，未设置ADMIN_TOKEN时一律为否"""
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get('X-Admin-Token', '')
+    # 按常数时间比较，避免通过响应时间逐位猜出口令
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def admin_error():
+    """非管理员请求的错误响应，是管理员时返回None"""
+    if not ADMIN_TOKEN:
+        return api_error("管理接口未启用: 需要设置 ADMIN_TOKEN", 403)
+    if not is_admin():
+        return api_error("没有权限", 403)
+    return None
+
+
+@app.route('/api/import', methods=['POST'])
+def api_import():
+    """批量导入景点（CSV或NDJSON）
+
+    可以用multipart上传file字段，也可以直接把文件内容作为请求体。
+    format=csv|ndjson，不指定时按文件名或Content-Type判断。
+    """
+    error = admin_error()
+    if error:
+        return error
+
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+    if fmt not in ('csv', 'ndjson'):
+        return api_error("format只支持csv或ndjson")
+
+    try:
+        report = import_locations(stream, fmt)
+    except Exception as e:
+        app.logger.error(f"批量导入错误: {e}")
+        return api_error(f"导入失败: {e}", 500)
+    return jsonify(report.to_dict())
+
+
+def iter_export_ids(locations, types=None, bbox=None):
+    """按类型和范围筛选要导出的景点编号"""
+    return iter(query_ids(locations, bbox, types))
+
+
+def export_chunks(fmt, types=None, bbox=None, compress=False):
+    """导出当前快照，逐块产出数据"""
+    locations = load_locations()
+    encode = EXPORT_FORMATS[fmt][0]
+    chunks = encode(locations, iter_export_ids(locations, types, bbox))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+@app.route('/api/export')
+def api_export():
+    """流式导出全部景点
+
+    参数: format=ndjson|geojson  type=类型（可用逗号分隔多个）
+          bbox=西,南,东,北  gzip=1 压缩输出
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return api_error("format只支持ndjson或geojson")
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+    except ValueError as e:
+        return api_error(f"参数错误: {e}")
+    types = parse_types(request.args.get('type'))
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    _, mimetype, extension = EXPORT_FORMATS[fmt]
+    response = Response(export_chunks(fmt, types, bbox, compress), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="locations.{extension}"'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def create_publisher(directory):
+    """把主页面和数据发布到directory的静态发布器"""
+    return SitePublisher(
+        directory,
+        assets={name: os.path.join(app.static_folder, name) for name in STATIC_URLS},
+        render_index=render_published_page,
+        clusters=published_clusters,
+        tile_zoom=int(PUBLISH_TILE_ZOOM) if PUBLISH_TILE_ZOOM else cluster_index.max_zoom - 1,
+        logger=app.logger)
+
+
+site_publisher = create_publisher(PUBLISH_DIR) if PUBLISH_DIR else None
+
+
+def schedule_publish(snapshot, added):
+    """数据变化时安排重新发布，只重新生成新增景点所在的数据文件"""
+    site_publisher.mark_dirty(0 if added is None else len(snapshot) - len(added))
+
+
+if site_publisher:
+    location_store.add_listener(schedule_publish)
 
 
 def get_local_ip():
@@ -325,9 +1385,10 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-if __name__ == '__main__':
+def run_server():
+    """启动Waitress生产服务器"""
     # 确保数据文件存在
-    if not os.path.exists(DATA_FILE):
+    if STORAGE_BACKEND == 'json' and not os.path.exists(DATA_FILE):
         save_locations(PRESET_LOCATIONS)
         app.logger.info("初始化位置数据文件")
 
@@ -345,5 +1406,133 @@ if __name__ == '__main__':
     app.logger.info("🛡️  使用 Waitress 生产服务器")
     app.logger.info("=" * 50)
 
+    if WEB_WORKERS > 1:
+        app.logger.info(f"🧵 多进程模式: {WEB_WORKERS} 个工作进程，共享快照 {SHARED_SNAPSHOT_FILE}")
+        serve_prefork(app, host, port, WEB_WORKERS, THREADS,
+                      worker_start=lambda index: start_worker(index, host),
+                      worker_exit=lambda index: stop_logging(),
+                      logger=app.logger)
+        return
+
+    start_background_services(host)
+
     # 使用Waitress生产服务器
-    serve(app, host=host, port=port, threads=4)
+    serve(app, host=host, port=port, threads=THREADS)
+
+
+def start_background_services(host):
+    """启动实时推送和静态发布，多进程时只在一个工作进程中运行"""
+    if LIVE_UPDATES:
+        try:
+            live_events.start(host, SSE_PORT)
+            app.logger.info(f"📡 实时更新: http://127.0.0.1:{SSE_PORT}{live_events.path}")
+        except OSError as e:
+            # 端口被占用等情况下不影响主服务，页面会退回定时检查数据版本
+            app.logger.warning(f"实时更新服务启动失败（端口 {SSE_PORT}），已关闭实时更新: {e}")
+
+    if site_publisher:
+        site_publisher.start(load_locations, PUBLISH_DELAY)
+        site_publisher.mark_dirty(0)
+        app.logger.info(f"📦 静态发布目录: {os.path.abspath(PUBLISH_DIR)}")
+
+
+def watch_locations():
+    """定期检查共享快照，及时得到其他进程新增的景点（用于实时推送和索引）"""
+    while True:
+        time.sleep(max(location_store.check_interval, 0.5))
+        location_store.snapshot()
+
+
+def start_worker(index, host):
+    """工作进程开始服务前执行"""
+    # 日志和性能分析结果按工作进程分开写，避免多个进程轮转或覆盖同一个文件
+    for handler in log_files:
+        use_worker_file(handler, index)
+    profiler.directory = os.path.join(profiler.directory, f"worker{index}")
+    metrics.const_labels = (('worker', index),)
+    threading.Thread(target=watch_locations, name="snapshot-watcher", daemon=True).start()
+    if index == 0:
+        start_background_services(host)
+
+
+def stop_logging():
+    """写完队列中剩余的日志"""
+    for listener in log_listeners:
+        listener.stop()
+
+
+def run_import(args):
+    """命令行批量导入"""
+    if args.file == '-':
+        stream = sys.stdin.buffer
+        fmt = args.format or 'ndjson'
+    else:
+        stream = open(args.file, 'rb')
+        fmt = args.format or detect_format(args.file)
+    with stream:
+        report = import_locations(stream, fmt)
+    for reject in report.rejects:
+        print(f"第{reject['line']}行: {reject['error']}", file=sys.stderr)
+    if report.rejected > len(report.rejects):
+        print(f"……另有 {report.rejected - len(report.rejects)} 条失败未列出", file=sys.stderr)
+    print(f"导入完成: 成功 {report.accepted} 条，失败 {report.rejected} 条")
+    return 1 if report.rejected else 0
+
+
+def run_export(args):
+    """命令行导出"""
+    try:
+        bbox = parse_bbox(args.bbox) if args.bbox else None
+    except ValueError as e:
+        print(f"参数错误: {e}", file=sys.stderr)
+        return 2
+    types = parse_types(args.type)
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    with output:
+        for chunk in export_chunks(args.format, types, bbox, args.gzip):
+            output.write(chunk)
+    return 0
+
+
+def run_publish(args):
+    """命令行发布静态页面"""
+    stats = create_publisher(args.output).publish(load_locations())
+    print(f"已发布到 {args.output}: 写入 {stats['written']} 个文件，未变 {stats['unchanged']} 个，"
+          f"删除 {stats['removed']} 个，用时 {stats['seconds']}s")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="澳门与广东旅游景点地图")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('serve', help="启动服务器（默认）")
+
+    import_parser = subparsers.add_parser('import', help="从CSV/NDJSON文件批量导入景点")
+    import_parser.add_argument('file', help="文件路径，- 表示标准输入")
+    import_parser.add_argument('--format', choices=['csv', 'ndjson'],
+                               help="文件格式，默认按扩展名判断")
+
+    export_parser = subparsers.add_parser('export', help="导出景点为NDJSON/GeoJSON")
+    export_parser.add_argument('-o', '--output', default='-', help="输出文件，默认标准输出")
+    export_parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+    export_parser.add_argument('--type', help="只导出这些类型，逗号分隔")
+    export_parser.add_argument('--bbox', help="只导出范围内的景点：西,南,东,北")
+    export_parser.add_argument('--gzip', action='store_true', help="gzip压缩输出")
+
+    publish_parser = subparsers.add_parser('publish', help="把主页面和数据发布为静态文件")
+    publish_parser.add_argument('-o', '--output', default=PUBLISH_DIR or 'public',
+                                help="输出目录，默认为PUBLISH_DIR或public")
+
+    args = parser.parse_args(argv)
+    if args.command == 'import':
+        return run_import(args)
+    if args.command == 'export':
+        return run_export(args)
+    if args.command == 'publish':
+        return run_publish(args)
+    run_server()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
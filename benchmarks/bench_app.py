@@ -0,0 +1,309 @@
+"""整个应用的负载测试：进程内（Flask测试客户端）和Waitress两种方式
+
+指定 --workers N（N>1）时另外以多进程模式（WEB_WORKERS=N）启动应用测试一遍。
+
+每个数据规模在单独的子进程和临时目录中运行，互不影响，也不会改动仓库中的数据文件。
+结果写入JSON文件，可用 benchmarks/compare.py 比较两次运行。
+
+用法: python benchmarks/bench_app.py [--sizes 1000,10000,100000] [--requests 200]
+                                     [--concurrency 8] [--backend json] [--workers 4]
+                                     [-o results.json]
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_memory import synthetic_json  # noqa: E402
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(name, target, latencies, elapsed):
+    """汇总一组请求的耗时（秒）"""
+    return {
+        "name": name,
+        "target": target,
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def run_load(send, requests, concurrency):
+    """用concurrency个线程共发出requests个请求，send(worker_state, i)返回状态码"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        start = time.perf_counter()
+        status = send(local, i)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f"{len(errors)} 个请求失败，例如状态码 {errors[0]}")
+    return latencies, elapsed
+
+
+def scenarios(rng, count):
+    """(名称, 方法, 路径生成函数, 是否表单提交)"""
+    def random_bbox(i):
+        lat, lng = rng.uniform(20, 24.9), rng.uniform(110, 116.9)
+        return f"{lng},{lat},{lng + 0.1},{lat + 0.1}"
+
+    def form(i):
+        return {
+            "name": f"压测景点{i}",
+            "lat": f"{rng.uniform(20, 25):.6f}",
+            "lng": f"{rng.uniform(110, 117):.6f}",
+            "type": "其他",
+            "description": "负载测试",
+        }
+
+    return [
+        ("GET /", "GET", lambda i: "/", None),
+        ("GET /api/locations bbox", "GET", lambda i: f"/api/locations?bbox={random_bbox(i)}", None),
+        ("GET /api/locations/<id>", "GET", lambda i: f"/api/locations/{rng.randrange(count)}", None),
+        ("GET /api/nearby", "GET", lambda i: (
+            f"/api/nearby?lat={rng.uniform(20, 25):.5f}&lng={rng.uniform(110, 117):.5f}&k=10"), None),
+        ("GET /api/clusters", "GET", lambda i: f"/api/clusters?bbox=110,20,117,25&zoom={rng.randint(5, 12)}", None),
+        ("POST /add_location burst", "POST", lambda i: "/add_location", form),
+    ]
+
+
+def bench_inprocess(app_module, rng, count, args):
+    results = []
+    for name, method, path, form in scenarios(rng, count):
+        def send(local, i, method=method, path=path, form=form):
+            if not hasattr(local, 'client'):
+                local.client = app_module.app.test_client()
+            if method == 'POST':
+                return local.client.post(path(i), data=form(i)).status_code
+            return local.client.get(path(i)).status_code
+        latencies, elapsed = run_load(send, args.requests, args.concurrency)
+        results.append(summarize(name, "inprocess", latencies, elapsed))
+    return results
+
+
+def bench_http(port, target, rng, count, args):
+    """通过HTTP测试运行在port上的服务器"""
+    results = []
+    for name, method, path, form in scenarios(rng, count):
+        def send(local, i, method=method, path=path, form=form):
+            if not hasattr(local, 'conn'):
+                local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            if method == 'POST':
+                body = urlencode(form(i))
+                local.conn.request('POST', path(i), body, {
+                    'Content-Type': 'application/x-www-form-urlencoded'})
+            else:
+                local.conn.request('GET', path(i), headers={'Accept-Encoding': 'gzip'})
+            response = local.conn.getresponse()
+            response.read()
+            return response.status
+        latencies, elapsed = run_load(send, args.requests, args.concurrency)
+        results.append(summarize(name, target, latencies, elapsed))
+    return results
+
+
+def bench_waitress(app_module, rng, count, args):
+    from waitress.server import create_server
+
+    server = create_server(app_module.app, host='127.0.0.1', port=0,
+                           threads=args.threads, connection_limit=1000)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        return bench_http(server.effective_port, "waitress", rng, count, args)
+    finally:
+        server.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench_prefork(rng, count, args):
+    """以多进程模式启动应用（在当前临时目录中）并测试"""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), HOST='127.0.0.1', WEB_WORKERS=str(args.workers))
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'app.py')], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("多进程模式启动失败")
+                time.sleep(0.2)
+        # 每个工作进程先渲染一次主页面，不计入结果
+        warmup = argparse.Namespace(**dict(vars(args), requests=args.workers * 4))
+        bench_http(port, "prefork", random.Random(0), count, warmup)
+        return bench_http(port, f"prefork{args.workers}", rng, count, args)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def page_sizes(app_module):
+    """主页面各种编码的大小（字节）"""
+    client = app_module.app.test_client()
+    sizes = {}
+    for encoding in ('identity', 'gzip', 'br'):
+        response = client.get('/', headers={'Accept-Encoding': encoding})
+        sizes[encoding] = len(response.data)
+    return sizes
+
+
+def worker(args):
+    """在临时目录中生成数据并测试一个数据规模，结果以JSON输出到标准输出"""
+    workdir = tempfile.mkdtemp(prefix='map-bench-')
+    os.chdir(workdir)
+    with open('locations.json', 'w', encoding='utf-8') as f:
+        f.write(synthetic_json(args.count, seed=args.seed))
+    os.environ.update({
+        'STORAGE_BACKEND': args.backend,
+        'LIVE_UPDATES': '0',
+        'THREADS': str(args.threads),
+    })
+    sys.path.insert(0, ROOT)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    import app as app_module
+    logging_off(app_module)
+    locations = app_module.load_locations()
+    load_s = time.perf_counter() - start
+
+    client = app_module.app.test_client()
+    start = time.perf_counter()
+    client.get('/')
+    first_page_s = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    result = {
+        "dataset": args.count,
+        "load_s": round(load_s, 3),
+        "first_page_ms": round(first_page_s * 1000, 3),
+        "page_bytes": page_sizes(app_module),
+        "table_bytes": locations.table.nbytes(),
+        "results": bench_inprocess(app_module, rng, args.count, args)
+                   + bench_waitress(app_module, rng, args.count, args)
+                   + (bench_prefork(rng, args.count, args) if args.workers > 1 else []),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "startup_rss_mb": round(rss_before / 1024, 1),
+    }
+    json.dump(result, sys.stdout)
+
+
+def logging_off(app_module):
+    """压测时只保留警告以上的日志，避免日志输出影响结果"""
+    app_module.app.logger.setLevel(logging.WARNING)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(datasets):
+    print(f"{'dataset':>8} {'target':<10}{'scenario':<28}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for data in datasets:
+        for r in data["results"]:
+            print(f"{data['dataset']:>8} {r['target']:<10}{r['name']:<28}"
+                  f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_rps']:>10.1f}")
+        pages = data["page_bytes"]
+        print(f"{data['dataset']:>8} 加载 {data['load_s']}s  首次渲染 {data['first_page_ms']}ms  "
+              f"页面 {pages['identity']}/{pages['gzip']}/{pages['br']} 字节(原始/gzip/br)  "
+              f"最大RSS {data['max_rss_mb']}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--requests', type=int, default=200, help="每个场景的请求数")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4, help="Waitress工作线程数")
+    parser.add_argument('--backend', choices=['json', 'journal', 'sqlite'], default='json')
+    parser.add_argument('--workers', type=int, default=1, help="另外测试的多进程模式工作进程数")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('--count', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    datasets = []
+    for count in [int(s) for s in args.sizes.split(',')]:
+        print(f"测试 {count} 个景点 ...", file=sys.stderr)
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', '--count', str(count),
+               '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+               '--threads', str(args.threads), '--backend', args.backend, '--seed', str(args.seed),
+               '--workers', str(args.workers)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            sys.exit(proc.returncode)
+        datasets.append(json.loads(proc.stdout))
+
+    report = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ('worker', 'count')},
+        },
+        "datasets": datasets,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_table(datasets)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
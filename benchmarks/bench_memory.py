@@ -0,0 +1,64 @@
+"""景点数据在内存中的占用：dict列表与列式表对比
+
+用法: python benchmarks/bench_memory.py [--count 1000000]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import LocationTable  # noqa: E402
+
+TYPES = ["历史遗迹", "历史建筑", "观景台", "主题公园", "餐饮", "自然风光", "博物馆", "其他"]
+
+
+def synthetic_json(count, seed=42):
+    """生成与locations.json格式相同的数据"""
+    rng = random.Random(seed)
+    return json.dumps([{
+        "name": f"景点{i}",
+        "location": [rng.uniform(20, 25), rng.uniform(110, 117)],
+        "type": rng.choice(TYPES),
+        "description": f"第{i}个测试景点，{rng.choice(TYPES)}附近",
+    } for i in range(count)], ensure_ascii=False)
+
+
+def measure(build):
+    """构建结果常驻内存的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    raw = synthetic_json(args.count)
+
+    dicts, dict_bytes = measure(lambda: json.loads(raw))
+    table, table_bytes = measure(lambda: LocationTable.from_locations(dicts, TYPES))
+    assert len(table) == len(dicts)
+    del dicts
+
+    per_million = 1000000 / args.count
+    print(f"景点数: {args.count:,}")
+    print(f"{'layout':<16}{'MB':>10}{'MB per 1M':>12}{'bytes/row':>12}")
+    for name, size in (("list of dict", dict_bytes), ("LocationTable", table_bytes)):
+        print(f"{name:<16}{size / 2**20:>10.1f}{size * per_million / 2**20:>12.1f}"
+              f"{size / args.count:>12.1f}")
+    print(f"节省: {1 - table_bytes / dict_bytes:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""空间索引与线性扫描的对比测试
+
+用法: python benchmarks/bench_spatial.py [--sizes 10000,100000,1000000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import haversine_m  # noqa: E402
+from spatial import GridIndex  # noqa: E402
+
+
+def random_points(n, rng):
+    """广东/澳门范围内的随机坐标"""
+    return [(rng.uniform(20, 25), rng.uniform(110, 117)) for _ in range(n)]
+
+
+def linear_bbox(points, south, west, north, east):
+    return [i for i, (lat, lng) in enumerate(points)
+            if south <= lat <= north and west <= lng <= east]
+
+
+def linear_radius(points, lat, lng, meters):
+    result = []
+    for i, (plat, plng) in enumerate(points):
+        d = haversine_m(lat, lng, plat, plng)
+        if d <= meters:
+            result.append((d, i))
+    result.sort()
+    return result
+
+
+def linear_nearest(points, lat, lng, k):
+    return sorted((haversine_m(lat, lng, plat, plng), i)
+                  for i, (plat, plng) in enumerate(points))[:k]
+
+
+def timeit(func, queries):
+    """每次查询的平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for q in queries:
+        func(*q)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def run(n, n_queries, rng):
+    points = random_points(n, rng)
+
+    start = time.perf_counter()
+    index = GridIndex()
+    index.rebuild(points)
+    build_s = time.perf_counter() - start
+
+    centers = [(rng.uniform(20, 25), rng.uniform(110, 117)) for _ in range(n_queries)]
+    # 约10km见方的范围，相当于缩放到城市级别时的可见区域
+    bbox_queries = [(lat, lng, lat + 0.1, lng + 0.1) for lat, lng in centers]
+    radius_queries = [(lat, lng, 5000) for lat, lng in centers]
+    knn_queries = [(lat, lng, 10) for lat, lng in centers]
+
+    # 线性扫描太慢，数据量大时减少查询次数
+    linear_n = max(3, n_queries * 10000 // n)
+    rows = [
+        ("bbox", timeit(lambda *q: linear_bbox(points, *q), bbox_queries[:linear_n]),
+         timeit(index.bbox, bbox_queries)),
+        ("radius 5km", timeit(lambda *q: linear_radius(points, *q), radius_queries[:linear_n]),
+         timeit(index.radius, radius_queries)),
+        ("knn k=10", timeit(lambda *q: linear_nearest(points, *q), knn_queries[:linear_n]),
+         timeit(index.nearest, knn_queries)),
+    ]
+
+    print(f"\nn={n:,}  索引构建 {build_s:.2f}s")
+    print(f"{'query':<12}{'linear ms':>12}{'index ms':>12}{'speedup':>10}")
+    for name, linear_ms, index_ms in rows:
+        print(f"{name:<12}{linear_ms:>12.3f}{index_ms:>12.3f}{linear_ms / index_ms:>9.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for n in (int(s) for s in args.sizes.split(',')):
+        run(n, args.queries, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""页面渲染耗时：每次请求编译模板与启动时预编译对比
+
+用法: python benchmarks/bench_templates.py [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as map_app  # noqa: E402
+from flask import render_template_string  # noqa: E402
+
+PANEL = '<div style="padding: 2rem;"><h2>坐标格式错误</h2></div>'
+
+
+def legacy_template():
+    """旧版模板：CSS和JS内联在页面中"""
+    static = map_app.app.static_folder
+    with open(os.path.join(static, 'style.css'), encoding='utf-8') as f:
+        css = f.read()
+    with open(os.path.join(static, 'app.js'), encoding='utf-8') as f:
+        js = f.read()
+    template = map_app.HTML_TEMPLATE
+    template = template.replace(
+        '<link rel="stylesheet" href="{{ static_urls[\'style.css\'] }}">',
+        f'<style>\n{css}</style>')
+    template = template.replace(
+        '<script src="{{ static_urls[\'app.js\'] }}" defer></script>',
+        f'<script>\n{js}</script>')
+    return template
+
+
+def timed(render, repeat):
+    """返回 (每次耗时ms, 页面字节数)"""
+    body = render()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render()
+    return (time.perf_counter() - start) * 1000 / repeat, len(body.encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    legacy = legacy_template()
+    cases = [
+        ("render_template_string", lambda: render_template_string(
+            legacy.replace('{{ map_html | safe }}', PANEL),
+            message="错误：请输入有效的经纬度坐标", message_type="error")),
+        ("precompiled", lambda: map_app.render_page(
+            panel_title="坐标格式错误",
+            message="错误：请输入有效的经纬度坐标", message_type="error")),
+    ]
+
+    print(f"{'variant':<24}{'ms/render':>12}{'bytes':>10}")
+    with map_app.app.test_request_context():
+        for name, render in cases:
+            ms, size = timed(render, args.repeat)
+            print(f"{name:<24}{ms:>12.3f}{size:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""比较两次 bench_app.py 的结果
+
+用法: python benchmarks/compare.py base.json new.json [--threshold 10]
+
+按 (数据规模, 运行方式, 场景) 对齐，列出p50/p99和吞吐量的变化；
+任一指标变差超过threshold百分比时返回码为1，可用于CI。
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    rows = {}
+    for data in report["datasets"]:
+        for r in data["results"]:
+            rows[(data["dataset"], r["target"], r["name"])] = r
+    return report, rows
+
+
+def change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help="视为变差的百分比")
+    args = parser.parse_args()
+
+    base_report, base = load(args.base)
+    new_report, new = load(args.new)
+    print(f"base: {base_report['meta'].get('commit')}  {base_report['meta']['time']}")
+    print(f"new:  {new_report['meta'].get('commit')}  {new_report['meta']['time']}")
+    print(f"{'dataset':>8} {'target':<10}{'scenario':<28}{'p50':>9}{'p99':>9}{'req/s':>9}")
+
+    regressions = 0
+    for key in sorted(set(base) & set(new)):
+        old, cur = base[key], new[key]
+        deltas = (change(old["p50_ms"], cur["p50_ms"]),
+                  change(old["p99_ms"], cur["p99_ms"]),
+                  -change(old["throughput_rps"], cur["throughput_rps"]))
+        worse = any(d > args.threshold for d in deltas)
+        regressions += worse
+        dataset, target, name = key
+        print(f"{dataset:>8} {target:<10}{name:<28}"
+              f"{deltas[0]:>+8.1f}%{deltas[1]:>+8.1f}%{-deltas[2]:>+8.1f}%{'  <-- 变差' if worse else ''}")
+
+    for key in sorted(set(base) ^ set(new)):
+        print(f"只在{'base' if key in base else 'new'}中出现: {key}")
+    print(f"{regressions} 项变差超过 {args.threshold}%")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
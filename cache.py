@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只提供gzip
+    brotli = None
+
+
+class VersionedCache:
+    """按数据版本区分的LRU缓存
+
+    键为 (version, key)，数据版本前进后旧版本的条目会被整体清除，
+    其余情况按最近最少使用淘汰，保证内存占用有上限。
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._latest_version = None
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def get(self, version, key=None):
+        """读取缓存，未命中返回None"""
+        with self._lock:
+            value = self._data.get((version, key))
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end((version, key))
+            self.hits += 1
+            return value
+
+    def put(self, version, key, value):
+        """写入缓存"""
+        with self._lock:
+            if self._latest_version is None or version > self._latest_version:
+                # 数据已更新，旧版本的结果不会再被用到
+                self._latest_version = version
+                for stale in [k for k in self._data if k[0] < version]:
+                    del self._data[stale]
+            elif version < self._latest_version:
+                return
+            self._data[(version, key)] = value
+            self._data.move_to_end((version, key))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_create(self, version, key, factory):
+        """读取缓存，未命中时调用factory生成；同一个键只生成一次"""
+        value = self.get(version, key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            build_lock = self._building.setdefault(
+                (version, key), threading.Lock())
+
+        with build_lock:
+            # 等待期间可能已经由其他线程生成
+            with self._lock:
+                value = self._data.get((version, key))
+            if value is None:
+                value = factory()
+                self.put(version, key, value)
+            with self._lock:
+                self._building.pop((version, key), None)
+        return value
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class CompressedPage:
+    """预先压缩好的页面
+
+    每个数据版本只在生成时压缩一次（gzip，安装了brotli时再加br）。
+    ETag默认为内容的哈希；内容中有随机部分（例如folium的元素编号）时，
+    由调用方按生成页面所用的数据传入etag，重新渲染或由其他进程渲染时保持不变。
+    """
+
+    __slots__ = ("body", "etag", "mimetype", "encodings")
+
+    def __init__(self, body, mimetype='text/html; charset=utf-8', min_size=1024, etag=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag or hashlib.sha1(body).hexdigest()
+        self.encodings = {}
+        if len(body) >= min_size:
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(body, quality=9)
+            self.encodings['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+
+    def select(self, accept_encodings):
+        """按客户端支持的压缩方式选择内容，返回 (编码, 数据)"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accept_encodings[encoding]:
+                return encoding, self.encodings[encoding]
+        return None, self.body
@@ -0,0 +1,162 @@
+import math
+import threading
+from contextlib import ExitStack
+from itertools import count as counter
+
+
+def project(lat, lng):
+    """经纬度转换为Web墨卡托归一化坐标 (x, y)，取值0~1"""
+    x = (lng + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(max(-85.05112878, min(85.05112878, lat))))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+class ClusterIndex:
+    """按缩放级别预先聚合的标记聚类
+
+    每个缩放级别把地图按屏幕上radius像素大小划分网格，网格内的景点合并为
+    一个聚类，记录数量和坐标和（用于计算中心）。相邻级别的网格正好是
+    2x2嵌套关系，因此全量构建时只需把最细一级逐级合并；新增景点时
+    每个级别只更新一个网格。超过max_zoom后直接返回单个景点。
+    """
+
+    def __init__(self, min_zoom=3, max_zoom=13, radius=60, tile_size=256):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.radius = radius
+        self.tile_size = tile_size
+        self.base_version = 0
+        self._lock = threading.RLock()
+        # 每级: {(cx, cy): [数量, 纬度和, 经度和, 第一个景点编号]}
+        self._levels = {z: {} for z in range(min_zoom, max_zoom + 1)}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _scale(self, zoom):
+        return self.tile_size * (2 ** zoom) / self.radius
+
+    def _key(self, x, y, zoom):
+        scale = self._scale(zoom)
+        return (int(x * scale), int(y * scale))
+
+    def insert(self, item_id, lat, lng):
+        """增量插入一个景点，每个级别更新一个网格"""
+        x, y = project(lat, lng)
+        with self._lock:
+            for zoom, cells in self._levels.items():
+                key = self._key(x, y, zoom)
+                cell = cells.get(key)
+                if cell is None:
+                    cells[key] = [1, lat, lng, item_id]
+                else:
+                    cell[0] += 1
+                    cell[1] += lat
+                    cell[2] += lng
+            self._count += 1
+
+    def rebuild(self, points, version=0, ids=None):
+        """用 (lat, lng) 序列全量重建，ids为各点的编号，默认依次为0,1,2..."""
+        finest = {}
+        count = 0
+        for item_id, (lat, lng) in zip(counter() if ids is None else ids, points):
+            key = self._key(*project(lat, lng), self.max_zoom)
+            cell = finest.get(key)
+            if cell is None:
+                finest[key] = [1, lat, lng, item_id]
+            else:
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lng
+            count += 1
+
+        levels = {self.max_zoom: finest}
+        for zoom in range(self.max_zoom - 1, self.min_zoom - 1, -1):
+            # 上一级网格坐标整除2即为本级网格
+            coarser = {}
+            for (cx, cy), (n, sum_lat, sum_lng, first_id) in levels[zoom + 1].items():
+                key = (cx >> 1, cy >> 1)
+                cell = coarser.get(key)
+                if cell is None:
+                    coarser[key] = [n, sum_lat, sum_lng, first_id]
+                else:
+                    cell[0] += n
+                    cell[1] += sum_lat
+                    cell[2] += sum_lng
+                    cell[3] = min(cell[3], first_id)
+            levels[zoom] = coarser
+
+        with self._lock:
+            self._levels = levels
+            self._count = count
+            self.base_version = version
+
+    def clusters(self, south, west, north, east, zoom):
+        """范围内的聚类
+
+        返回 [(数量, 纬度, 经度, 编号或展开级别)]：数量为1时为单个景点的编号，
+        否则为点击后应放大到的级别。zoom超过max_zoom时返回None，由调用方
+        直接查询单个景点。
+        """
+        return merged_clusters([self], south, west, north, east, zoom)
+
+
+def _expansion_zoom(indexes, key, zoom):
+    """聚类展开为多个子聚类的最小缩放级别"""
+    max_zoom = indexes[0].max_zoom
+    cx, cy = key
+    while zoom < max_zoom:
+        found = [(cx * 2 + dx, cy * 2 + dy) for dx in (0, 1) for dy in (0, 1)
+                 if any((cx * 2 + dx, cy * 2 + dy) in index._levels[zoom + 1] for index in indexes)]
+        zoom += 1
+        if len(found) != 1:
+            return zoom
+        cx, cy = found[0]
+    return max_zoom + 1
+
+
+def merged_clusters(indexes, south, west, north, east, zoom):
+    """把参数相同的多个聚类索引（例如各类型分别建立的）合并查询，返回格式同clusters"""
+    first = indexes[0]
+    zoom = max(first.min_zoom, int(zoom))
+    if zoom > first.max_zoom:
+        return None
+    x0, y0 = project(north, west)
+    x1, y1 = project(south, east)
+    i0, j0 = first._key(x0, y0, zoom)
+    i1, j1 = first._key(x1, y1, zoom)
+
+    with ExitStack() as stack:
+        for index in indexes:
+            stack.enter_context(index._lock)
+        merged = {}
+        for index in indexes:
+            cells = index._levels[zoom]
+            if (i1 - i0 + 1) * (j1 - j0 + 1) <= len(cells):
+                items = (((i, j), cells.get((i, j)))
+                         for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+            else:
+                items = ((key, cell) for key, cell in cells.items()
+                         if i0 <= key[0] <= i1 and j0 <= key[1] <= j1)
+            for key, cell in items:
+                if cell is None:
+                    continue
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = list(cell)
+                else:
+                    total[0] += cell[0]
+                    total[1] += cell[1]
+                    total[2] += cell[2]
+                    total[3] = min(total[3], cell[3])
+
+        result = []
+        for key, (n, sum_lat, sum_lng, first_id) in merged.items():
+            if n == 1:
+                result.append((1, sum_lat, sum_lng, first_id))
+            else:
+                result.append((n, sum_lat / n, sum_lng / n,
+                               _expansion_zoom(indexes, key, zoom)))
+    return result
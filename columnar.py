@@ -0,0 +1,286 @@
+import json
+import struct
+from array import array
+from collections.abc import Mapping, Sequence
+
+# 每条记录固定包含的字段，其余字段放在extras中
+FIELDS = ("name", "location", "type", "description")
+
+# 二进制快照文件: 魔数、头部长度、JSON头部，之后是按8字节对齐的各列
+SNAPSHOT_MAGIC = b'LOCTBL01'
+_HEADER = struct.Struct('<8sQ')
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+class LocationTable:
+    """列式存储的景点数据
+
+    坐标存放在两个 array('d') 中，类型编码为小整数（对应categories），
+    名称和描述以UTF-8依次拼接在同一个bytearray里，只记录每段的结束位置。
+    相比每个景点一个dict（加上嵌套的坐标列表和重复的类型字符串），
+    每条记录的额外开销只有几十字节。表只追加不修改，
+    快照按自己的长度读取，因此可以与写入并发。
+    """
+
+    def __init__(self, categories=()):
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.type_codes = array('H')
+        self.categories = []
+        self._category_codes = {}
+        self._text = bytearray()
+        # 每条记录两个值：名称结束位置、描述结束位置
+        self._ends = array('Q')
+        self._extras = {}
+        for category in categories:
+            self.type_code(category)
+
+    @classmethod
+    def from_locations(cls, locations, categories=()):
+        """由景点记录构建"""
+        table = cls(categories)
+        for loc in locations:
+            table.append(loc)
+        return table
+
+    def __len__(self):
+        return len(self.lats)
+
+    def type_code(self, type_name):
+        """类型对应的编码，新类型自动分配"""
+        code = self._category_codes.get(type_name)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(type_name)
+            self._category_codes[type_name] = code
+        return code
+
+    def append(self, loc):
+        """追加一条记录，返回编号"""
+        lat, lng = loc["location"]
+        name = loc["name"].encode('utf-8')
+        description = (loc.get("description") or "").encode('utf-8')
+        code = self.type_code(loc["type"])
+
+        row = len(self.lats)
+        extras = {k: v for k, v in loc.items() if k not in FIELDS}
+        if extras:
+            self._extras[row] = extras
+        self._text += name
+        self._ends.append(len(self._text))
+        self._text += description
+        self._ends.append(len(self._text))
+        self.type_codes.append(code)
+        self.lngs.append(float(lng))
+        # 纬度最后写入，读取方以len(lats)为准，不会看到写了一半的记录
+        self.lats.append(float(lat))
+        return row
+
+    def _slice(self, index):
+        start = self._ends[index - 1] if index else 0
+        return str(self._text[start:self._ends[index]], 'utf-8')
+
+    def name(self, row):
+        return self._slice(2 * row)
+
+    def description(self, row):
+        return self._slice(2 * row + 1)
+
+    def type_name(self, row):
+        return self.categories[self.type_codes[row]]
+
+    def location(self, row):
+        return (self.lats[row], self.lngs[row])
+
+    def extras(self, row):
+        return self._extras.get(row)
+
+    def copy(self, count=None):
+        """前count条记录的可追加副本，用于从只读的映射表派生新表"""
+        count = len(self) if count is None else count
+        table = LocationTable(self.categories)
+        table.lats.frombytes(memoryview(self.lats)[:count].cast('B'))
+        table.lngs.frombytes(memoryview(self.lngs)[:count].cast('B'))
+        table.type_codes.frombytes(memoryview(self.type_codes)[:count].cast('B'))
+        table._ends.frombytes(memoryview(self._ends)[:2 * count].cast('B'))
+        table._text += self._text[:self._ends[2 * count - 1] if count else 0]
+        table._extras = {row: extras for row, extras in self._extras.items() if row < count}
+        return table
+
+    def dump(self, f, meta=None):
+        """写出为二进制快照，meta随头部保存，可用from_buffer读回"""
+        count = len(self)
+        header = json.dumps({
+            "count": count,
+            "categories": self.categories,
+            "text_bytes": len(self._text),
+            "extras": {str(row): extras for row, extras in self._extras.items()},
+            "meta": meta,
+        }, ensure_ascii=False).encode('utf-8')
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, len(header)))
+        f.write(header + _padding(len(header)))
+        for column in (self.lats, self.lngs, self._ends, self.type_codes):
+            data = memoryview(column).cast('B')
+            f.write(data)
+            f.write(_padding(len(data)))
+        f.write(self._text)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """直接引用dump写出的数据（例如mmap）构建只读表，不复制各列，返回 (表, meta)"""
+        view = memoryview(buffer)
+        magic, header_size = _HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("不是景点快照文件")
+        offset = _HEADER.size
+        header = json.loads(str(view[offset:offset + header_size], 'utf-8'))
+        offset += header_size + len(_padding(header_size))
+        count = header["count"]
+
+        table = cls(header["categories"])
+        columns = []
+        for fmt, length in (('d', count), ('d', count), ('Q', 2 * count), ('H', count)):
+            size = struct.calcsize(fmt) * length
+            columns.append(view[offset:offset + size].cast(fmt))
+            offset += size + len(_padding(size))
+        table.lats, table.lngs, table._ends, table.type_codes = columns
+        table._text = view[offset:offset + header["text_bytes"]]
+        table._extras = {int(row): extras for row, extras in header["extras"].items()}
+        return table, header["meta"]
+
+    def nbytes(self):
+        """列数据占用的字节数（不含extras）"""
+        return (self.lats.itemsize * len(self.lats) + self.lngs.itemsize * len(self.lngs)
+                + self.type_codes.itemsize * len(self.type_codes)
+                + self._ends.itemsize * len(self._ends) + len(self._text))
+
+
+class ChainedTable:
+    """只读的基础表后接一张可追加的表，行号连续
+
+    多进程共享时基础表映射自快照文件，之后追加的记录放在进程自己的尾部表中，
+    不必为追加几条记录复制整张基础表。
+    """
+
+    def __init__(self, base, tail=None):
+        self.base = base
+        self.tail = tail if tail is not None else LocationTable(base.categories)
+        self._split = len(base)
+
+    def __len__(self):
+        return self._split + len(self.tail)
+
+    def _locate(self, row):
+        if row < self._split:
+            return self.base, row
+        return self.tail, row - self._split
+
+    def append(self, loc):
+        """追加一条记录到尾部表，返回编号"""
+        return self._split + self.tail.append(loc)
+
+    def name(self, row):
+        table, row = self._locate(row)
+        return table.name(row)
+
+    def description(self, row):
+        table, row = self._locate(row)
+        return table.description(row)
+
+    def type_name(self, row):
+        table, row = self._locate(row)
+        return table.type_name(row)
+
+    def location(self, row):
+        table, row = self._locate(row)
+        return table.location(row)
+
+    def extras(self, row):
+        table, row = self._locate(row)
+        return table.extras(row)
+
+    def merged(self):
+        """合并为一张连续的表，用于写出新的快照文件"""
+        table = self.base.copy()
+        for row in range(len(self.tail)):
+            table.append(LocationView(self.tail, row))
+        return table
+
+
+class LocationView(Mapping):
+    """列式存储中一条记录的只读视图，可以像dict一样按字段读取"""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    @property
+    def row(self):
+        return self._row
+
+    def __getitem__(self, key):
+        table, row = self._table, self._row
+        if key == "location":
+            return table.location(row)
+        if key == "name":
+            return table.name(row)
+        if key == "type":
+            return table.type_name(row)
+        if key == "description":
+            return table.description(row)
+        extras = table.extras(row)
+        if extras is not None and key in extras:
+            return extras[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from FIELDS
+        extras = self._table.extras(self._row)
+        if extras:
+            yield from extras
+
+    def __len__(self):
+        extras = self._table.extras(self._row)
+        return len(FIELDS) + (len(extras) if extras else 0)
+
+    def __repr__(self):
+        return f"LocationView({dict(self)!r})"
+
+
+class Snapshot(Sequence):
+    """某一数据版本下全部景点的只读快照
+
+    只记录表和自己的长度，之后追加到表中的记录对该快照不可见。
+    version为本进程内的版本号；generation标识整体加载或替换得到的一份数据，
+    之后只在末尾追加，多进程共享时各进程相同，(generation, 长度) 即可确定内容。
+    """
+
+    __slots__ = ("table", "version", "generation", "_size")
+
+    def __init__(self, table, version, size=None, generation=None):
+        self.table = table
+        self.version = version
+        self.generation = generation
+        self._size = len(table) if size is None else size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LocationView(self.table, row) for row in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("景点编号超出范围")
+        return LocationView(self.table, index)
+
+    def __iter__(self):
+        table = self.table
+        for row in range(self._size):
+            yield LocationView(table, row)
@@ -0,0 +1,57 @@
+import json
+import zlib
+
+from geo import to_feature, to_record
+
+# 每次产出的记录数，太小会增加开销，太大会推迟首字节
+CHUNK_RECORDS = 500
+
+
+def iter_ndjson(locations, ids):
+    """逐块产出NDJSON，每行一个景点"""
+    lines = []
+    for location_id in ids:
+        lines.append(json.dumps(to_record(locations[location_id], location_id), ensure_ascii=False))
+        if len(lines) >= CHUNK_RECORDS:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_geojson(locations, ids):
+    """逐块产出GeoJSON FeatureCollection"""
+    yield b'{"type": "FeatureCollection", "features": ['
+    first = True
+    parts = []
+    for location_id in ids:
+        feature = json.dumps(to_feature(locations[location_id], location_id), ensure_ascii=False)
+        parts.append(feature if first else ',' + feature)
+        first = False
+        if len(parts) >= CHUNK_RECORDS:
+            yield '\n'.join(parts).encode('utf-8')
+            parts = []
+    if parts:
+        yield '\n'.join(parts).encode('utf-8')
+    yield b']}\n'
+
+
+def gzip_chunks(chunks, level=6):
+    """把数据块流式压缩为gzip格式"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if first:
+            # 第一块立即输出，客户端不用等压缩缓冲区填满
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson", "ndjson"),
+    "geojson": (iter_geojson, "application/geo+json", "geojson"),
+}
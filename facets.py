@@ -0,0 +1,59 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+
+
+class TypeIndex:
+    """每个类型的景点编号列表（按编号递增）
+
+    按类型筛选时直接取对应列表，耗时只与筛选结果的数量有关；
+    各类型的数量即为列表长度，可随新增景点增量更新。
+    """
+
+    def __init__(self):
+        self.base_version = 0
+        self._lock = threading.Lock()
+        self._postings = {}
+
+    def __contains__(self, type_name):
+        return type_name in self._postings
+
+    def insert(self, item_id, type_name):
+        """插入一个景点，编号需递增"""
+        with self._lock:
+            postings = self._postings.get(type_name)
+            if postings is None:
+                postings = self._postings[type_name] = array('I')
+            postings.append(item_id)
+
+    def rebuild(self, types, version=0):
+        """用各景点类型的序列全量重建"""
+        postings = {}
+        for item_id, type_name in enumerate(types):
+            items = postings.get(type_name)
+            if items is None:
+                items = postings[type_name] = array('I')
+            items.append(item_id)
+        with self._lock:
+            self._postings = postings
+            self.base_version = version
+
+    def counts(self, count=None):
+        """各类型的景点数；count为快照长度，之后新增的景点不计入"""
+        with self._lock:
+            postings = dict(self._postings)
+        if count is None:
+            return {name: len(items) for name, items in postings.items()}
+        return {name: bisect_left(items, count) for name, items in postings.items()}
+
+    def ids(self, types, count=None):
+        """属于types中任一类型的景点编号，按编号递增"""
+        with self._lock:
+            lists = [self._postings[t] for t in types if t in self._postings]
+            # 在锁内截取，避免与插入同时读写同一个数组
+            lists = [items[:len(items) if count is None else bisect_left(items, count)]
+                     for items in lists]
+        if len(lists) == 1:
+            return lists[0]
+        return list(heapq.merge(*lists))
@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+# 地球平均半径（米）
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """两点之间的球面距离（米）"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_matrix(lats, lngs):
+    """一组点两两之间的球面距离矩阵（米），向量化计算"""
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lmb = np.radians(np.asarray(lngs, dtype=np.float64))
+    a = np.sin((phi[:, None] - phi[None, :]) * 0.5) ** 2
+    a += np.cos(phi)[:, None] * np.cos(phi)[None, :] * np.sin((lmb[:, None] - lmb[None, :]) * 0.5) ** 2
+    np.sqrt(a, out=a)
+    np.minimum(a, 1.0, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_M
+    return a
+
+
+def haversine_columns(lat, lng, rad_lats, rad_lngs, cos_lats):
+    """一个点到一组点的球面距离（米），向量化计算
+
+    使用预先算好的弧度和纬度余弦，省去一半的三角函数计算。
+    """
+    phi1 = math.radians(lat)
+    a = np.sin((rad_lats - phi1) * 0.5)
+    a *= a
+    b = np.sin((rad_lngs - math.radians(lng)) * 0.5)
+    b *= b
+    b *= cos_lats
+    b *= math.cos(phi1)
+    a += b
+    np.sqrt(a, out=a)
+    np.minimum(a, 1.0, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_M
+    return a
+
+
+def parse_bbox(value):
+    """解析 "西,南,东,北" 格式的范围参数（与GeoJSON的bbox顺序一致）
+
+    返回 (south, west, north, east)，格式错误时抛出ValueError。
+    超出经纬度范围的部分（例如地图缩得很小时的视野）截到 ±90/±180 以内。
+    """
+    parts = [float(p) for p in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError("bbox需要4个数值：西,南,东,北")
+    if not all(math.isfinite(p) for p in parts):
+        raise ValueError("bbox需要有限的数值")
+    west, south, east, north = parts
+    west, east = max(west, -180.0), min(east, 180.0)
+    south, north = max(south, -90.0), min(north, 90.0)
+    if south > north or west > east:
+        raise ValueError("bbox范围无效")
+    return south, west, north, east
+
+
+def in_bbox(loc, bbox):
+    """判断景点是否在范围内"""
+    south, west, north, east = bbox
+    lat, lng = loc["location"]
+    return south <= lat <= north and west <= lng <= east
+
+
+def to_feature(loc, location_id):
+    """转换为GeoJSON Feature，注意GeoJSON坐标顺序为 [经度, 纬度]"""
+    lat, lng = loc["location"]
+    return {
+        "type": "Feature",
+        "id": location_id,
+        "geometry": {"type": "Point", "coordinates": [lng, lat]},
+        "properties": {
+            "name": loc["name"],
+            "type": loc["type"],
+            "description": loc.get("description", ""),
+        },
+    }
+
+
+def to_record(loc, location_id):
+    """转换为普通JSON记录"""
+    record = dict(loc)
+    record["id"] = location_id
+    record["location"] = list(loc["location"])
+    return record
@@ -0,0 +1,165 @@
+import codecs
+import csv
+import io
+import json
+
+# 广东/澳门坐标范围，与add_location的校验一致
+LAT_RANGE = (20, 25)
+LNG_RANGE = (110, 117)
+
+
+class ImportReport:
+    """导入结果：成功和失败数量，以及前max_rejects条失败原因（行号从1开始）"""
+
+    def __init__(self, max_rejects=1000):
+        self.max_rejects = max_rejects
+        self.accepted = 0
+        self.rejected = 0
+        self.rejects = []
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejects) < self.max_rejects:
+            self.rejects.append({"line": line, "error": reason})
+
+    def to_dict(self):
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "rejects": self.rejects,
+            "rejects_truncated": self.rejected > len(self.rejects),
+        }
+
+
+def detect_format(filename='', content_type=''):
+    """根据文件名或Content-Type判断格式"""
+    filename = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if filename.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return 'ndjson'
+
+
+ENCODING_ERROR = "编码错误: 不是有效的UTF-8文本"
+
+
+def _decode_lines(stream, bad_lines):
+    """逐行按UTF-8解码二进制输入，无法解码的行号记入bad_lines，内容按替换字符解码"""
+    for lineno, raw in enumerate(iter(stream.readline, b''), 1):
+        if lineno == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(lineno)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def iter_rows(stream, fmt):
+    """逐行读取输入，产出 (行号, 原始记录)；无法解析的行产出 (行号, 错误信息)
+
+    二进制输入逐行解码，个别行不是UTF-8时只有这一行（CSV为包含该行的记录）失败。
+    """
+    bad_lines = set()
+    if not isinstance(stream, io.TextIOBase):
+        stream = _decode_lines(stream, bad_lines)
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        # 读取fieldnames时消耗表头行
+        reader.fieldnames
+        end = reader.line_num
+        for row in reader:
+            # 带引号的字段可以跨行，一条记录占 (上一条的末行, line_num] 这些行
+            start, end = end + 1, reader.line_num
+            if any(lineno in bad_lines for lineno in range(start, end + 1)):
+                bad_lines.difference_update(range(start, end + 1))
+                yield end, ENCODING_ERROR
+                continue
+            yield end, row
+        return
+
+    for lineno, line in enumerate(stream, 1):
+        if lineno in bad_lines:
+            bad_lines.discard(lineno)
+            yield lineno, ENCODING_ERROR
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield lineno, f"JSON格式错误: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield lineno, "每行需要是一个JSON对象"
+            continue
+        yield lineno, record
+
+
+def validate_row(row, known_types):
+    """校验并转换一条记录，不合法时抛出ValueError"""
+    name = str(row.get("name") or "").strip()
+    location_type = str(row.get("type") or "").strip()
+    description = str(row.get("description") or "").strip()
+
+    if "location" in row and row["location"] is not None:
+        try:
+            lat, lng = row["location"]
+        except (TypeError, ValueError):
+            raise ValueError("location需要是 [纬度, 经度]")
+    else:
+        lat, lng = row.get("lat"), row.get("lng")
+
+    if not name or location_type == "" or lat in (None, "") or lng in (None, ""):
+        raise ValueError("缺少必填字段（name, lat, lng, type）")
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("经纬度格式错误")
+    if not (LAT_RANGE[0] <= lat <= LAT_RANGE[1] and LNG_RANGE[0] <= lng <= LNG_RANGE[1]):
+        raise ValueError("坐标不在广东/澳门范围内")
+    if location_type not in known_types:
+        raise ValueError(f"未知类型: {location_type}")
+
+    return {
+        "name": name,
+        "location": [lat, lng],
+        "type": location_type,
+        "description": description,
+    }
+
+
+def iter_valid_batches(stream, fmt, known_types, report, batch_size=1000):
+    """流式读取并按批校验，产出合法景点的列表，失败记录写入report
+
+    每次只在内存中保留一批记录，输入文件再大占用也不变。
+    """
+    batch = []
+    for lineno, row in iter_rows(stream, fmt):
+        batch.append((lineno, row))
+        if len(batch) >= batch_size:
+            valid = _validate_batch(batch, known_types, report)
+            if valid:
+                yield valid
+            batch = []
+    if batch:
+        valid = _validate_batch(batch, known_types, report)
+        if valid:
+            yield valid
+
+
+def _validate_batch(batch, known_types, report):
+    valid = []
+    for lineno, row in batch:
+        if isinstance(row, str):
+            report.reject(lineno, row)
+            continue
+        try:
+            valid.append(validate_row(row, known_types))
+        except ValueError as e:
+            report.reject(lineno, str(e))
+    report.accepted += len(valid)
+    return valid
@@ -0,0 +1,145 @@
+import time
+from itertools import permutations
+
+import numpy as np
+
+# 改进量小于该值（米）时视为没有改进，避免浮点误差导致反复交换
+_EPSILON = 1e-6
+
+# 不超过该数量的点直接枚举全部顺序（最多7!=5040种），得到最短路线
+EXACT_LIMIT = 8
+
+
+def route_length(dist, path):
+    """按path顺序经过各点的总距离"""
+    path = np.asarray(path)
+    return float(dist[path[:-1], path[1:]].sum())
+
+
+def nearest_neighbour(dist, start=0):
+    """最近邻构造初始路线：每次走到最近的未访问点"""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    path = np.empty(n, dtype=np.int64)
+    current = start
+    for step in range(n):
+        path[step] = current
+        visited[current] = True
+        if step == n - 1:
+            break
+        row = np.where(visited, np.inf, dist[current])
+        current = int(np.argmin(row))
+    return path
+
+
+def exact_route(dist, start=0, closed=False):
+    """枚举起点之外各点的全部排列，向量化计算长度，返回最短的路线"""
+    n = len(dist)
+    others = [i for i in range(n) if i != start]
+    orders = np.array(list(permutations(others)), dtype=np.int64).reshape(-1, n - 1)
+    ends = [np.full((len(orders), 1), start)]
+    paths = np.hstack(ends + [orders] + (ends if closed else []))
+    lengths = dist[paths[:, :-1], paths[:, 1:]].sum(axis=1)
+    return paths[int(np.argmin(lengths))]
+
+
+def two_opt(dist, path, deadline, closed=False):
+    """2-opt：翻转一段路线，消除交叉的边
+
+    path[0]为固定的起点；closed为True时path[-1]是回到的起点，也保持不动。
+    对每个i向量化计算所有j的改进量，取最大的一个。返回是否有改进。
+    """
+    n = len(path)
+    last = n - 2 if closed else n - 1
+    changed = False
+    for i in range(n - 2):
+        if time.perf_counter() > deadline:
+            break
+        js = np.arange(i + 2, last + 1)
+        if not len(js):
+            break
+        a, b = path[i], path[i + 1]
+        c = path[js]
+        delta = dist[a, c] - dist[a, b]
+        # j为开放路线的最后一个点时，后面没有边
+        e = path[np.minimum(js + 1, n - 1)]
+        delta += np.where(js < n - 1, dist[b, e] - dist[c, e], 0.0)
+        k = int(np.argmin(delta))
+        if delta[k] < -_EPSILON:
+            j = js[k]
+            path[i + 1:j + 1] = path[i + 1:j + 1][::-1].copy()
+            changed = True
+    return changed
+
+
+def or_opt(dist, path, deadline, closed=False, max_segment=3):
+    """Or-opt：把连续1~max_segment个点（可翻转）移到路线的其他位置
+
+    返回 (新路线, 是否有改进)。
+    """
+    changed = False
+    for length in range(1, max_segment + 1):
+        i = 1
+        while True:
+            n = len(path)
+            end = n - 1 if closed else n
+            if i + length > end or time.perf_counter() > deadline:
+                break
+            first, last = path[i], path[i + length - 1]
+            prev = path[i - 1]
+            has_next = i + length < n
+            nxt = path[i + length] if has_next else None
+            removed = dist[prev, first]
+            if has_next:
+                removed += dist[last, nxt] - dist[prev, nxt]
+
+            rest = np.concatenate((path[:i], path[i + length:]))
+            # 插入到rest[p]和rest[p+1]之间；开放路线还可以接在最后
+            us = rest[:-1]
+            vs = rest[1:]
+            forward = dist[us, first] + dist[last, vs] - dist[us, vs]
+            backward = dist[us, last] + dist[first, vs] - dist[us, vs]
+            if not closed:
+                forward = np.append(forward, dist[rest[-1], first])
+                backward = np.append(backward, dist[rest[-1], last])
+            # 放回原处不算移动
+            forward[i - 1] = np.inf
+            backward[i - 1] = np.inf
+            best_forward = int(np.argmin(forward))
+            best_backward = int(np.argmin(backward))
+            if forward[best_forward] <= backward[best_backward]:
+                p, cost, segment = best_forward, forward[best_forward], path[i:i + length]
+            else:
+                p, cost, segment = best_backward, backward[best_backward], path[i:i + length][::-1]
+            if cost - removed < -_EPSILON:
+                path = np.concatenate((rest[:p + 1], segment, rest[p + 1:]))
+                changed = True
+            else:
+                i += 1
+    return path, changed
+
+
+def plan_route(dist, start=0, closed=False, time_budget=0.2):
+    """规划经过所有点的顺序
+
+    不超过EXACT_LIMIT个点时枚举全部顺序，结果最短；更多时先用最近邻得到初始路线，
+    再交替使用2-opt和Or-opt改进，直到没有改进或超过time_budget秒，结果是近似的。
+    closed为True时最后回到起点。返回 (各点下标的顺序, 总距离)，
+    顺序不包含回到起点的最后一步。
+    """
+    if len(dist) <= EXACT_LIMIT:
+        path = exact_route(dist, start, closed)
+    else:
+        deadline = time.perf_counter() + time_budget
+        path = nearest_neighbour(dist, start)
+        if closed:
+            path = np.append(path, start)
+        while time.perf_counter() < deadline:
+            improved = two_opt(dist, path, deadline, closed)
+            path, moved = or_opt(dist, path, deadline, closed)
+            if not (improved or moved):
+                break
+    total = route_length(dist, path)
+    if closed:
+        path = path[:-1]
+    return path.tolist(), total
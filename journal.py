@@ -0,0 +1,384 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from store import fsync_dir, write_json_atomic
+
+
+class JournalBackend:
+    """追加写日志存储
+
+    每个新景点以一行NDJSON记录追加到日志并fsync，插入成本与数据量无关；
+    启动时读取快照再重放日志恢复数据。日志超过阈值后在后台线程中
+    合并为新的快照。每条记录带递增序号，快照记录已包含的最大序号，
+    因此合并过程中任何时刻崩溃都不会丢失或重复数据。
+    多个进程共用同一个日志时，用sync()从上次读到的位置继续读取其他进程追加的记录。
+    """
+
+    def __init__(self, path, snapshot_path=None, import_path=None,
+                 defaults=(), compact_bytes=4 * 1024 * 1024, logger=None):
+        self.path = path
+        self.snapshot_path = snapshot_path or f"{path}.snapshot.json"
+        self.compacting_path = f"{path}.compacting"
+        self.compact_lock_path = f"{path}.compact.lock"
+        self.import_path = import_path
+        self.defaults = list(defaults)
+        self.compact_bytes = compact_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._file = None
+        self._seq = 0
+        self._compactor = None
+        self._own_disk_signature = None
+        # 本进程已读到或写到的日志位置，以及当时日志文件的inode
+        self._offset = 0
+        self._ino = None
+
+    def _disk_signature(self):
+        sig = []
+        for path in (self.snapshot_path, self.compacting_path, self.path):
+            try:
+                st = os.stat(path)
+                sig.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def _is_own(self, disk):
+        """磁盘状态与本进程最后一次读写后是否一致，调用方需持有锁
+
+        其他进程的合并结束时先替换快照、再删除旧日志，日志文件不变，数据也没有变化。
+        """
+        own = self._own_disk_signature
+        if disk == own:
+            return True
+        return (own is not None and own[1] is not None and disk[1] in (None, own[1])
+                and disk[2] == own[2])
+
+    def signature(self):
+        """存储的版本标识
+
+        文件只被本进程修改过（包括后台合并）时返回逻辑序号，
+        合并不会被误认为外部修改；否则返回文件状态。
+        """
+        with self._lock:
+            disk = self._disk_signature()
+            if self._is_own(disk):
+                return ('seq', self._seq)
+            return disk
+
+    @contextmanager
+    def _compaction_lock(self):
+        """跨进程的合并锁：多个进程共用日志时，轮换日志和结束合并不能交错"""
+        with open(self.compact_lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _remember_position(self, offset=None):
+        """记录本进程写入后的文件状态和日志位置，调用方需持有锁"""
+        self._own_disk_signature = self._disk_signature()
+        self._offset = self._file.tell() if offset is None else offset
+        self._ino = os.fstat(self._file.fileno()).st_ino
+
+    def _read_snapshot(self):
+        """读取快照，返回 (序号, 景点列表)"""
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get("seq", 0), data.get("locations", [])
+
+    def _replay(self, path, locations, seq):
+        """重放日志文件，返回 (最大序号, 有效数据的字节长度)
+
+        批量导入的记录带有txn字段，读到对应的commit记录后才生效；
+        末尾没有提交的批量导入视为中断，连同后面的内容一起丢弃。
+        """
+        valid_bytes = 0
+        pending = None
+        if not os.path.exists(path):
+            return seq, valid_bytes
+        with open(path, 'rb') as f:
+            for lineno, raw in enumerate(f, 1):
+                if not raw.endswith(b'\n'):
+                    # 最后一行没有写完整（写入时崩溃），丢弃
+                    self.logger.warning(f"日志 {path} 第{lineno}行不完整，已忽略")
+                    break
+                offset = valid_bytes
+                valid_bytes += len(raw)
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    self.logger.warning(f"日志 {path} 第{lineno}行已损坏，已跳过")
+                    continue
+                if record["seq"] <= seq:
+                    continue
+                seq = record["seq"]
+                if "txn" in record:
+                    if pending is None or pending[0] != record["txn"]:
+                        pending = (record["txn"], offset, [])
+                    pending[2].append(record["data"])
+                elif "commit" in record:
+                    if pending is not None and pending[0] == record["commit"]:
+                        locations.extend(pending[2])
+                        pending = None
+                else:
+                    locations.append(record["data"])
+        if pending is not None:
+            self.logger.warning(f"日志 {path} 末尾有未提交的批量导入（{len(pending[2])}条），已丢弃")
+            valid_bytes = pending[1]
+        return seq, valid_bytes
+
+    def _initial_locations(self):
+        """导入已有的JSON数据文件，没有则使用预设数据"""
+        if self.import_path and os.path.exists(self.import_path):
+            with open(self.import_path, 'r', encoding='utf-8') as f:
+                locations = json.load(f)
+            self.logger.info(f"从 {self.import_path} 导入 {len(locations)} 个景点")
+            return locations
+        return list(self.defaults)
+
+    def load(self):
+        """读取快照并重放日志"""
+        # 其他进程的合并可能正在替换快照、删除旧日志，读取期间不能结束合并
+        with self._lock, self._compaction_lock():
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            if os.path.exists(self.snapshot_path):
+                seq, locations = self._read_snapshot()
+            elif not os.path.exists(self.path):
+                seq, locations = 0, self._initial_locations()
+                write_json_atomic(self.snapshot_path,
+                                  {"seq": 0, "locations": locations})
+            else:
+                seq, locations = 0, []
+
+            # 合并中的旧日志可能部分已写入快照，按序号跳过重复记录
+            seq, _ = self._replay(self.compacting_path, locations, seq)
+            seq, valid_bytes = self._replay(self.path, locations, seq)
+            self._seq = seq
+
+            self._file = open(self.path, 'ab')
+            if self._file.tell() > valid_bytes:
+                # 截掉不完整的尾部，避免新记录接在残缺行后面
+                self._file.truncate(valid_bytes)
+            self._remember_position(valid_bytes)
+            return locations
+
+    def _read_since(self, path, offset, seq):
+        """从offset开始读取序号紧接seq的记录，返回 (新景点, 最大序号, 读到的位置)
+
+        序号不连续、内容不完整或文件比offset短时（例如被整体替换后重写），
+        无法确定与已读内容的关系，返回None。
+        """
+        locations = []
+        pending = None
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < offset:
+                return None
+            f.seek(offset)
+            for raw in f:
+                try:
+                    record = json.loads(raw) if raw.endswith(b'\n') else None
+                except ValueError:
+                    record = None
+                # 整体替换会跳过一个序号，之后的记录与已读内容不连续
+                if record is None or record.get("seq") != seq + 1:
+                    return None
+                seq += 1
+                offset += len(raw)
+                if "txn" in record:
+                    pending = pending or []
+                    pending.append(record["data"])
+                elif "commit" in record:
+                    locations.extend(pending or ())
+                    pending = None
+                else:
+                    locations.append(record["data"])
+        # 写入方持有跨进程写锁，读取时不会有未提交的批量导入
+        return (locations, seq, offset) if pending is None else None
+
+    def sync(self):
+        """读取其他进程追加到日志的记录，返回新增的景点
+
+        只从本进程上次读到或写到的位置继续读；其他进程开始合并日志时，
+        先读完改名后的旧日志剩余部分。数据被整体替换、旧日志已合并删除等
+        无法增量追上的情况返回None，需要调用load()。调用方需持有跨进程的写锁。
+        """
+        with self._lock:
+            if self._is_own(self._disk_signature()):
+                return []
+            try:
+                ino = os.stat(self.path).st_ino
+                added, seq, offset = [], self._seq, self._offset
+                if ino != self._ino:
+                    # 旧日志被其他进程改名为compacting_path，正在合并
+                    if os.stat(self.compacting_path).st_ino != self._ino:
+                        return None
+                    result = self._read_since(self.compacting_path, offset, seq)
+                    if result is None:
+                        return None
+                    added, seq, offset = result[0], result[1], 0
+                result = self._read_since(self.path, offset, seq)
+            except OSError:
+                return None
+            if result is None:
+                return None
+            if ino != self._ino:
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.path, 'ab')
+            self._seq = result[1]
+            self._remember_position(result[2])
+            return added + result[0]
+
+    def append(self, new_locations, all_locations):
+        """把新景点追加到日志"""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            lines = []
+            for loc in new_locations:
+                self._seq += 1
+                lines.append(json.dumps({"seq": self._seq, "data": dict(loc)},
+                                        ensure_ascii=False))
+            self._file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._remember_position()
+
+            if self._file.tell() >= self.compact_bytes and self._compactor is None:
+                self._start_compaction()
+
+    def begin_bulk(self, existing):
+        """开始批量追加，所有记录在commit时一起生效"""
+        return _JournalBulkWriter(self)
+
+    def save_all(self, locations):
+        """整体替换：直接写新快照并清空日志"""
+        with self._lock:
+            self._seq += 1
+            write_json_atomic(self.snapshot_path,
+                              {"seq": self._seq, "locations": [dict(loc) for loc in locations]})
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, 'wb')
+            os.fsync(self._file.fileno())
+            with self._compaction_lock():
+                # 正在进行的合并（包括其他进程的）发现快照已被替换后会放弃结果
+                if os.path.exists(self.compacting_path):
+                    os.remove(self.compacting_path)
+            self._remember_position(0)
+
+    def _start_compaction(self):
+        """切换到新日志文件，在后台合并旧日志，调用方需持有锁
+
+        其他进程的合并还没结束时不轮换，日志暂时继续增长。
+        """
+        with self._compaction_lock():
+            if os.path.exists(self.compacting_path):
+                return
+            self._file.close()
+            os.replace(self.path, self.compacting_path)
+            base = (os.stat(self.snapshot_path), os.stat(self.compacting_path).st_ino)
+        fsync_dir(self.path)
+        self._file = open(self.path, 'ab')
+        self._remember_position(0)
+        self._compactor = threading.Thread(
+            target=self._compact, args=base, name="journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compact(self, base_stat, compacting_ino):
+        """把快照和旧日志合并为新快照
+
+        base_stat和compacting_ino是轮换日志时快照的状态和旧日志的inode。
+        """
+        try:
+            base_seq, locations = self._read_snapshot()
+            seq, _ = self._replay(self.compacting_path, locations, base_seq)
+            tmp_path = f"{self.snapshot_path}.compact"
+            write_json_atomic(tmp_path, {"seq": seq, "locations": locations})
+            with self._lock, self._compaction_lock():
+                st = os.stat(self.snapshot_path)
+                if (st.st_ino, st.st_mtime_ns) != (base_stat.st_ino, base_stat.st_mtime_ns):
+                    # 合并期间数据被整体替换（可能由其他进程），本次结果已过期
+                    os.remove(tmp_path)
+                    # 旧日志可能已被删除，之后又有进程轮换出新的，不能误删
+                    try:
+                        if os.stat(self.compacting_path).st_ino == compacting_ino:
+                            os.remove(self.compacting_path)
+                    except FileNotFoundError:
+                        pass
+                    return
+                os.replace(tmp_path, self.snapshot_path)
+                os.remove(self.compacting_path)
+                fsync_dir(self.snapshot_path)
+            self.logger.info(f"日志合并完成，快照包含 {len(locations)} 个景点")
+        except Exception as e:
+            self.logger.error(f"日志合并错误: {e}")
+        finally:
+            with self._lock:
+                self._compactor = None
+
+    def close(self):
+        """关闭日志文件"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _JournalBulkWriter:
+    """批量导入：记录带同一个txn编号依次追加，最后写commit记录并fsync一次"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        backend._lock.acquire()
+        try:
+            if backend._file is None:
+                backend._file = open(backend.path, 'ab')
+            # 其他进程可能在本进程打开文件后追加过，以文件末尾为准
+            self.start = backend._file.seek(0, os.SEEK_END)
+            self.txn = backend._seq + 1
+        except BaseException:
+            backend._lock.release()
+            raise
+
+    def write(self, locations):
+        backend = self.backend
+        lines = []
+        for loc in locations:
+            backend._seq += 1
+            lines.append(json.dumps({"seq": backend._seq, "txn": self.txn, "data": dict(loc)},
+                                    ensure_ascii=False))
+        if lines:
+            backend._file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+    def commit(self):
+        backend = self.backend
+        try:
+            backend._seq += 1
+            record = json.dumps({"seq": backend._seq, "commit": self.txn})
+            backend._file.write((record + '\n').encode('utf-8'))
+            backend._file.flush()
+            os.fsync(backend._file.fileno())
+            backend._remember_position()
+            if backend._file.tell() >= backend.compact_bytes and backend._compactor is None:
+                backend._start_compaction()
+        finally:
+            backend._lock.release()
+
+    def abort(self):
+        backend = self.backend
+        try:
+            backend._file.flush()
+            backend._file.truncate(self.start)
+            backend._remember_position(self.start)
+        finally:
+            backend._lock.release()
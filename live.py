@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+
+class EventBroker:
+    """通过Server-Sent Events把数据变化推送给浏览器
+
+    在单独线程的asyncio事件循环中运行，所有订阅连接共用这一个线程，
+    空闲的连接不会占用Waitress的工作线程。最近的事件保存在环形缓冲区中，
+    浏览器断线重连时按Last-Event-ID补发，缺口太大时改为发送reload事件。
+    """
+
+    def __init__(self, path='/events', history=256, heartbeat=15.0,
+                 max_clients=10000, client_queue=256, logger=None):
+        self.path = path
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.client_queue = client_queue
+        self.logger = logger or logging.getLogger(__name__)
+        # 以下状态只在事件循环线程中访问
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+        self._clients = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._loop is not None
+
+    def client_count(self):
+        return len(self._clients)
+
+    def start(self, host, port):
+        """在后台线程中启动SSE服务，端口被占用等错误直接抛出"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(asyncio.start_server(
+                    self._handle, host, port, backlog=1024, limit=16384))
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            self._loop = loop
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="sse-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+
+    def publish(self, event, data):
+        """发布事件，可在任意线程调用，不会阻塞"""
+        loop = self._loop
+        if loop is None:
+            return
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        loop.call_soon_threadsafe(self._broadcast, event, payload)
+
+    def _broadcast(self, event, payload):
+        event_id = self._next_id
+        self._next_id += 1
+        message = f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode('utf-8')
+        self._history.append((event_id, message))
+        for client in list(self._clients):
+            try:
+                client.put_nowait(message)
+            except asyncio.QueueFull:
+                # 读取太慢的连接直接断开，浏览器重连后按Last-Event-ID补发
+                self._clients.discard(client)
+                while not client.empty():
+                    client.get_nowait()
+                client.put_nowait(None)
+
+    def _replay(self, last_id):
+        """重连时需要补发的事件"""
+        if last_id is None or last_id >= self._next_id:
+            return []
+        if not self._history or self._history[0][0] > last_id + 1:
+            reload = json.dumps({"reason": "missed"})
+            return [f"event: reload\ndata: {reload}\n\n".encode('utf-8')]
+        return [message for event_id, message in self._history if event_id > last_id]
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError, ConnectionError):
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, _ = lines[0].split(' ', 2)
+            except ValueError:
+                return
+            headers = {}
+            for line in lines[1:]:
+                name, sep, value = line.partition(':')
+                if sep:
+                    headers[name.strip().lower()] = value.strip()
+
+            url = urlsplit(target)
+            if method not in ('GET', 'HEAD') or url.path != self.path:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n'
+                             b'Connection: close\r\n\r\n')
+                return
+            if len(self._clients) >= self.max_clients:
+                writer.write(b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 30\r\n'
+                             b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+
+            last_id = headers.get('last-event-id') or parse_qs(url.query).get('lastEventId', [None])[0]
+            try:
+                last_id = int(last_id) if last_id is not None else None
+            except ValueError:
+                last_id = None
+
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream; charset=utf-8\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Connection: keep-alive\r\n'
+                         b'X-Accel-Buffering: no\r\n'
+                         b'Access-Control-Allow-Origin: *\r\n\r\n')
+            if method == 'HEAD':
+                return
+            writer.write(b'retry: 3000\n\n')
+            # 补发和登记之间没有await，不会漏掉或重复事件
+            for message in self._replay(last_id):
+                writer.write(message)
+            client = asyncio.Queue(maxsize=self.client_queue)
+            self._clients.add(client)
+            try:
+                await writer.drain()
+                while True:
+                    try:
+                        message = await asyncio.wait_for(client.get(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        message = b': ping\n\n'
+                    if message is None:
+                        break
+                    writer.write(message)
+                    await writer.drain()
+            finally:
+                self._clients.discard(client)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            self.logger.error(f"SSE连接错误: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,63 @@
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra中的fields字段合并到顶层"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def attach_queue_handlers(logger, *handlers):
+    """logger只把日志放入队列，由后台线程写到handlers
+
+    请求线程不再做文件写入和轮转，日志磁盘慢时也不影响请求耗时。
+    返回已启动的QueueListener，进程退出时自动停止并写完队列中剩余的日志。
+    """
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    handler = QueueHandler(log_queue)
+    logger.addHandler(handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_in_child():
+        # fork出的子进程中没有后台线程，换一个新队列重新启动
+        handler.queue = listener.queue = queue.SimpleQueue()
+        listener._thread = None
+        listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    return listener
+
+
+def use_worker_file(handler, index):
+    """让文件日志改写到工作进程自己的文件：app.log → app.worker<index>.log
+
+    多个进程各自轮转同一个文件时会互相覆盖，每个进程需要单独的文件。
+    在fork出的工作进程中调用，重启的进程沿用原来的编号和文件。
+    """
+    root, ext = os.path.splitext(handler.baseFilename)
+    handler.acquire()
+    try:
+        if handler.stream:
+            handler.stream.close()
+        handler.baseFilename = f"{root}.worker{index}{ext}"
+        handler.stream = handler._open()
+    finally:
+        handler.release()
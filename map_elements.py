@@ -0,0 +1,353 @@
+import os
+
+from branca.element import Element, Figure, MacroElement
+from jinja2 import Template
+
+# 各地图脚本共用的函数（escapeHtml、makeIcon等），每个页面只内联一次
+HELPERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'map_helpers.js')
+with open(HELPERS_PATH, encoding='utf-8') as _f:
+    HELPERS_JS = _f.read()
+
+
+class MapScript(MacroElement):
+    """使用共用函数mapHelpers的地图脚本，渲染时把共用函数加入页面头部
+
+    按固定名称加入，同一页面中有多个这样的元素时也只包含一份。
+    """
+
+    def render(self, **kwargs):
+        figure = self.get_root()
+        if isinstance(figure, Figure):
+            figure.header.add_child(Element(f"<script>\n{HELPERS_JS}</script>"), name='map_helpers')
+        super().render(**kwargs)
+
+
+class ApiMarkerLoader(MapScript):
+    """地图移动或缩放后，通过接口只加载可见范围内的标记
+
+    接口按当前缩放级别返回聚类或单个景点，聚类显示为带数量的圆点，
+    点击后放大到聚类展开的级别。
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var layer = L.layerGroup().addTo(map);
+            var iconConfig = {{ this.icon_config|tojson }};
+            var pending = null;
+
+            function addCluster(f) {
+                var coords = f.geometry.coordinates;
+                var p = f.properties;
+                L.marker([coords[1], coords[0]], {icon: mapHelpers.clusterIcon(p.point_count)})
+                    .on('click', function() {
+                        map.setView([coords[1], coords[0]], p.expansion_zoom);
+                    })
+                    .addTo(layer);
+            }
+
+            function load() {
+                var b = map.getBounds();
+                var bbox = [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].join(',');
+                if (pending) { pending.abort(); }
+                pending = new AbortController();
+                var url = {{ this.url|tojson }} + '?bbox=' + bbox + '&zoom=' + map.getZoom();
+                {% if this.types %}
+                url += '&type=' + encodeURIComponent({{ this.types|join(',')|tojson }});
+                {% endif %}
+                fetch(url, {signal: pending.signal})
+                    .then(function(resp) { return resp.json(); })
+                    .then(function(data) {
+                        layer.clearLayers();
+                        data.features.forEach(function(f) {
+                            if (f.properties.cluster) {
+                                addCluster(f);
+                                return;
+                            }
+                            var p = f.properties;
+                            var coords = f.geometry.coordinates;
+                            L.marker([coords[1], coords[0]], {icon: mapHelpers.makeIcon(iconConfig, p.type)})
+                                .bindTooltip(mapHelpers.escapeHtml(p.name))
+                                .bindPopup(mapHelpers.popupHtml(p))
+                                .addTo(layer);
+                        });
+                    })
+                    .catch(function() {});
+            }
+
+            map.on('moveend', load);
+            load();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, url, icon_config, types=None):
+        super().__init__()
+        self._name = "ApiMarkerLoader"
+        self.url = url
+        self.icon_config = icon_config
+        self.types = sorted(types) if types else None
+
+
+class LiveMarkerLayer(MapScript):
+    """接收页面转发的实时更新，在现有地图上直接添加新景点
+
+    known_count为页面生成时已包含的景点数，编号小于它的景点不再重复添加；
+    数据被整体替换（reload事件）后编号不再对应，改为提示用户刷新页面。
+    为None时（api模式）收到更新后重新加载当前可见范围。
+    groups为 {类型: FeatureGroup}，新标记加入对应类型的图层；
+    types为页面筛选的类型，其他类型的景点不添加。
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var iconConfig = {{ this.icon_config|tojson }};
+            var knownCount = {{ this.known_count|tojson }};
+            var types = {{ this.types|tojson }};
+            var groups = {
+                {%- for type_name, group in this.groups.items() %}
+                {{ type_name|tojson }}: {{ group.get_name() }}{{ "," if not loop.last }}
+                {%- endfor %}
+            };
+            var added = {};
+            var refreshTimer = null;
+            var stale = false;
+
+            function addFeature(f) {
+                var p = f.properties;
+                if (f.id < knownCount || added[f.id]) { return; }
+                if (types && types.indexOf(p.type) < 0) { return; }
+                added[f.id] = true;
+                var coords = f.geometry.coordinates;
+                L.marker([coords[1], coords[0]], {icon: mapHelpers.makeIcon(iconConfig, p.type)})
+                    .bindTooltip(mapHelpers.escapeHtml(p.name))
+                    .bindPopup(mapHelpers.popupHtml(p))
+                    .addTo(groups[p.type] || map);
+            }
+
+            function refresh() {
+                // 合并短时间内的多次更新，只重新加载一次
+                clearTimeout(refreshTimer);
+                refreshTimer = setTimeout(function() { map.fire('moveend'); }, 500);
+            }
+
+            function showStale() {
+                // 页面中的标记已与数据不一致，之后的增量更新也不再添加
+                if (stale) { return; }
+                stale = true;
+                var banner = L.control({position: 'topright'});
+                banner.onAdd = function() {
+                    var div = L.DomUtil.create('div', 'leaflet-bar');
+                    div.style.cssText = 'background:#fff8e1;padding:6px 10px;font:13px Arial;';
+                    div.innerHTML = '景点数据已变化，<a href="#">刷新页面</a>查看最新数据';
+                    L.DomEvent.disableClickPropagation(div);
+                    div.querySelector('a').addEventListener('click', function(e) {
+                        e.preventDefault();
+                        // 地图在主页面的iframe中，刷新整个页面
+                        window.top.location.reload();
+                    });
+                    return div;
+                };
+                banner.addTo(map);
+            }
+
+            window.addEventListener('message', function(e) {
+                var msg = e.data;
+                if (!msg || !msg.liveUpdate) { return; }
+                if (knownCount === null) {
+                    refresh();
+                } else if (msg.liveUpdate === 'reload') {
+                    showStale();
+                } else if (msg.liveUpdate === 'locations' && !stale) {
+                    msg.data.features.forEach(addFeature);
+                }
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, icon_config, known_count=None, groups=None, types=None):
+        super().__init__()
+        self._name = "LiveMarkerLayer"
+        self.icon_config = icon_config
+        self.known_count = known_count
+        self.groups = groups or {}
+        self.types = sorted(types) if types else None
+
+
+class LazyPopups(MapScript):
+    """标记只带编号和提示文字，点击时才从接口加载弹窗内容
+
+    页面中不再为每个标记生成弹窗HTML，加载过的内容留在标记上不再重复请求。
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var url = {{ this.url|tojson }};
+
+            function attach(marker, id) {
+                var loaded = false;
+                marker.bindPopup('加载中…');
+                marker.on('popupopen', function() {
+                    if (loaded) { return; }
+                    fetch(url + id)
+                        .then(function(resp) {
+                            if (!resp.ok) { throw new Error(resp.status); }
+                            return resp.json();
+                        })
+                        .then(function(loc) {
+                            loaded = true;
+                            marker.setPopupContent(mapHelpers.popupHtml(loc));
+                        })
+                        .catch(function() {
+                            marker.setPopupContent('加载失败，请重试');
+                        });
+                });
+            }
+
+            map.eachLayer(function(layer) {
+                if (layer.options && layer.options.locationId !== undefined) {
+                    attach(layer, layer.options.locationId);
+                }
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, url):
+        super().__init__()
+        self._name = "LazyPopups"
+        self.url = url
+
+
+class StaticDataLoader(MapScript):
+    """静态发布的页面使用：从发布目录中的数据文件加载标记，不需要接口
+
+    manifest为SitePublisher生成的文件列表。数据按Web墨卡托瓦片分文件，
+    只读取与可见范围相交的瓦片：缩放级别不超过聚类最大级别时读取该级别的聚类，
+    更大时读取景点数据。文件名含内容哈希，读取过的文件留在内存中不再重复请求。
+    弹窗内容点击时从景点所在瓦片的数据中取出。
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var layer = L.layerGroup().addTo(map);
+            var iconConfig = {{ this.icon_config|tojson }};
+            var manifest = {{ this.manifest|tojson }};
+            var zooms = Object.keys(manifest.clusters).map(Number);
+            var minZoom = Math.min.apply(null, zooms);
+            var maxZoom = Math.max.apply(null, zooms);
+            var cache = {};
+            var current = 0;
+
+            function getJSON(url) {
+                if (!cache[url]) {
+                    cache[url] = fetch(url).then(function(resp) {
+                        if (!resp.ok) { throw new Error(resp.status); }
+                        return resp.json();
+                    });
+                    cache[url].catch(function() { delete cache[url]; });
+                }
+                return cache[url];
+            }
+
+            function tileOf(latlng, zoom) {
+                // 与SitePublisher的tile_key相同的瓦片编号
+                var n = Math.pow(2, zoom);
+                var p = map.project(latlng, zoom).divideBy(256).floor();
+                return [Math.min(n - 1, Math.max(0, p.x)), Math.min(n - 1, Math.max(0, p.y))];
+            }
+
+            function visibleFiles(tiles, zoom, b) {
+                // 与可见范围相交、且有数据的瓦片文件
+                var nw = tileOf(b.getNorthWest(), zoom);
+                var se = tileOf(b.getSouthEast(), zoom);
+                var files = [];
+                for (var x = nw[0]; x <= se[0]; x++) {
+                    for (var y = nw[1]; y <= se[1]; y++) {
+                        if (tiles[x + '/' + y]) { files.push(tiles[x + '/' + y]); }
+                    }
+                }
+                return files;
+            }
+
+            function addPoint(lat, lng, id, type, name) {
+                var marker = L.marker([lat, lng], {icon: mapHelpers.makeIcon(iconConfig, type)})
+                    .bindTooltip(mapHelpers.escapeHtml(name))
+                    .bindPopup('加载中…')
+                    .addTo(layer);
+                marker.on('popupopen', function() {
+                    var tile = tileOf([lat, lng], manifest.tile_zoom);
+                    getJSON(manifest.points[tile[0] + '/' + tile[1]])
+                        .then(function(data) {
+                            var found = data.features.filter(function(f) { return f.id === id; })[0];
+                            marker.setPopupContent(mapHelpers.popupHtml(found.properties));
+                        })
+                        .catch(function() {
+                            marker.setPopupContent('加载失败，请重试');
+                        });
+                });
+            }
+
+            function load() {
+                var b = map.getBounds();
+                var zoom = map.getZoom();
+                var request = ++current;
+                if (zoom <= maxZoom) {
+                    var level = Math.max(zoom, minZoom);
+                    var tileZoom = Math.max(0, level - manifest.cluster_tile_offset);
+                    var files = visibleFiles(manifest.clusters[level], tileZoom, b);
+                    Promise.all(files.map(getJSON)).then(function(tiles) {
+                        if (request !== current) { return; }
+                        layer.clearLayers();
+                        tiles.forEach(function(data) {
+                            data.clusters.forEach(function(c) {
+                                if (!b.contains([c[1], c[2]])) { return; }
+                                if (c[0] === 1) {
+                                    addPoint(c[1], c[2], c[3], c[4], c[5]);
+                                    return;
+                                }
+                                L.marker([c[1], c[2]], {icon: mapHelpers.clusterIcon(c[0])})
+                                    .on('click', function() { map.setView([c[1], c[2]], c[3]); })
+                                    .addTo(layer);
+                            });
+                        });
+                    }).catch(function() {});
+                    return;
+                }
+                var files = visibleFiles(manifest.points, manifest.tile_zoom, b);
+                Promise.all(files.map(getJSON)).then(function(tiles) {
+                    if (request !== current) { return; }
+                    layer.clearLayers();
+                    tiles.forEach(function(data) {
+                        data.features.forEach(function(f) {
+                            var p = f.properties;
+                            var coords = f.geometry.coordinates;
+                            if (!b.contains([coords[1], coords[0]])) { return; }
+                            L.marker([coords[1], coords[0]], {icon: mapHelpers.makeIcon(iconConfig, p.type)})
+                                .bindTooltip(mapHelpers.escapeHtml(p.name))
+                                .bindPopup(mapHelpers.popupHtml(p))
+                                .addTo(layer);
+                        });
+                    });
+                }).catch(function() {});
+            }
+
+            map.on('moveend', load);
+            load();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, manifest, icon_config):
+        super().__init__()
+        self._name = "StaticDataLoader"
+        self.manifest = manifest
+        self.icon_config = icon_config
@@ -0,0 +1,146 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 延迟直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """指标基类，按标签值的元组分别计数
+
+    指定callback时不在本地计数，导出时调用callback()取得 {标签元组: 值}，
+    用于导出其他对象已有的统计（例如缓存命中数）。
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """产出 (名称后缀, 标签字符串, 值)"""
+        if self.callback is not None:
+            items = self.callback().items()
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for labels, value in items:
+            yield '', list(zip(self.labelnames, labels)), value
+
+    def render(self, const_labels=()):
+        """导出为文本，const_labels为加在每个样本前面的 [(标签名, 值)]"""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for suffix, pairs, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_labels(list(const_labels) + pairs)} {_number(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """分桶计数，记录一次只需一次二分查找和一次加锁"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [各桶计数（最后一个为+Inf）, 总和]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in items:
+            pairs = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', pairs + [('le', _number(float(bound)))], cumulative
+            yield '_sum', pairs, total
+            yield '_count', pairs, cumulative
+
+
+class Registry:
+    """指标集合，导出为Prometheus文本格式
+
+    const_labels加在所有样本上：多进程时各工作进程分别计数，每次抓取只会到达其中一个，
+    用worker标签区分，各进程的计数器各自单调递增，不会因为换了进程而倒退。
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, const_labels=()):
+        self.const_labels = tuple(const_labels)
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), callback=None):
+        return self.register(Counter(name, help, labelnames, callback))
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self.register(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        return '\n'.join(metric.render(self.const_labels) for metric in self._metrics) + '\n'
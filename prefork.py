@@ -0,0 +1,79 @@
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+from waitress import serve
+
+
+def serve_prefork(app, host, port, workers, threads=4, worker_start=None, worker_exit=None,
+                  logger=None):
+    """预先fork多个Waitress工作进程，共用同一个监听套接字
+
+    主进程只负责监听端口、启动和回收工作进程：工作进程异常退出后自动重启，
+    收到SIGTERM或SIGINT时通知所有工作进程退出并等待结束。
+    fork之前主进程中已加载的数据和索引由各工作进程共享（写时复制）。
+    worker_start(index) 和 worker_exit(index) 在工作进程中开始服务前和退出前调用，
+    index为0..workers-1，重启的进程沿用原来的编号。
+    """
+    logger = logger or logging.getLogger(__name__)
+    sock = socket.create_server((host, port), backlog=1024)
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid:
+            children[pid] = (index, time.monotonic())
+            return
+        # 工作进程
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            if worker_start:
+                worker_start(index)
+            serve(app, sockets=[sock], threads=threads)
+        except (SystemExit, KeyboardInterrupt):
+            pass
+        except Exception as e:
+            logger.error(f"工作进程 {index} 异常退出: {e}")
+            code = 1
+        finally:
+            if worker_exit:
+                worker_exit(index)
+            os._exit(code)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    logger.info(f"已启动 {workers} 个工作进程，每个进程 {threads} 个线程")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index, started = children.pop(pid, (None, 0))
+        if index is None or stopping:
+            continue
+        logger.warning(f"工作进程 {index}（pid {pid}）退出，状态 {os.waitstatus_to_exitcode(status)}，重新启动")
+        if time.monotonic() - started < 1:
+            # 启动后立即退出时放慢重启，避免反复fork
+            time.sleep(1)
+        if not stopping:
+            spawn(index)
+    sock.close()
+    logger.info("所有工作进程已退出")
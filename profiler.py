@@ -0,0 +1,161 @@
+import cProfile
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+def _slug(route):
+    """路由转为文件名"""
+    return re.sub(r'[^0-9A-Za-z_.-]+', '_', route).strip('_') or 'root'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    """按比例抽样分析请求，结果按路由汇总写入目录
+
+    mode为cprofile时用cProfile记录被抽中的请求，输出 <路由>.pstats；
+    mode为sample时由后台线程每隔interval秒采集这些请求所在线程的调用栈，
+    输出 <路由>.collapsed（flamegraph.pl / speedscope 可直接读取）。
+    rate为0时每个请求只多一次比较。
+    """
+
+    MODES = ('cprofile', 'sample')
+
+    def __init__(self, directory, rate=0.0, mode='sample', interval=0.005,
+                 flush_interval=30.0, logger=None):
+        self.directory = directory
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.rate = 0.0
+        self.mode = 'sample'
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._stacks = defaultdict(Counter)
+        self._requests = Counter()
+        self._active = {}
+        self._sampler = None
+        self._last_flush = time.monotonic()
+        self.configure(rate, mode)
+
+    def configure(self, rate=None, mode=None):
+        """修改抽样比例和方式，可在运行中调用"""
+        if mode is not None:
+            if mode not in self.MODES:
+                raise ValueError(f"mode只支持: {', '.join(self.MODES)}")
+            self.mode = mode
+        if rate is not None:
+            rate = float(rate)
+            if not 0 <= rate <= 1:
+                raise ValueError("rate需要在0到1之间")
+            self.rate = rate
+        if self.rate > 0 and self.mode == 'sample':
+            self._ensure_sampler()
+
+    def status(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "mode": self.mode,
+                "directory": self.directory,
+                "profiled_requests": dict(self._requests),
+            }
+
+    def begin(self, route):
+        """请求开始时调用，未被抽中返回None"""
+        if self.rate <= 0 or random.random() >= self.rate:
+            return None
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 同一线程中已有其他分析器在运行
+                return None
+            return route, profile
+        with self._lock:
+            self._active[threading.get_ident()] = route
+        return route, None
+
+    def end(self, token):
+        """请求结束时调用，汇总本次请求的结果"""
+        route, profile = token
+        with self._lock:
+            self._requests[route] += 1
+            if profile is None:
+                self._active.pop(threading.get_ident(), None)
+        if profile is not None:
+            profile.disable()
+            with self._lock:
+                if route in self._stats:
+                    self._stats[route].add(profile)
+                else:
+                    self._stats[route] = pstats.Stats(profile)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _ensure_sampler(self):
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._sample_loop, name="request-sampler", daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, route in list(self._active.items()):
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    if stack:
+                        self._stacks[route][';'.join(reversed(stack))] += 1
+
+    def flush(self):
+        """把目前汇总的结果写入文件，返回写出的文件列表"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            stats = dict(self._stats)
+            stacks = {route: Counter(counts) for route, counts in self._stacks.items()}
+        os.makedirs(self.directory, exist_ok=True)
+        written = []
+        try:
+            for route, route_stats in stats.items():
+                path = os.path.join(self.directory, f"{_slug(route)}.pstats")
+                with self._lock:
+                    route_stats.dump_stats(path)
+                written.append(path)
+            for route, counts in stacks.items():
+                path = os.path.join(self.directory, f"{_slug(route)}.collapsed")
+                tmp = path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    for stack, count in counts.most_common():
+                        f.write(f"{stack} {count}\n")
+                os.replace(tmp, path)
+                written.append(path)
+        except OSError as e:
+            self.logger.error(f"写入性能分析结果失败: {e}")
+        return written
+
+    def reset(self):
+        """清空已汇总的结果"""
+        with self._lock:
+            self._stats.clear()
+            self._stacks.clear()
+            self._requests.clear()
@@ -0,0 +1,217 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from cluster import project
+from geo import to_feature
+
+MANIFEST = 'manifest.json'
+INDEX = 'index.html'
+# 缩放级别z的聚类按z-CLUSTER_TILE_OFFSET级的瓦片分文件，一屏通常只涉及1~4个文件
+CLUSTER_TILE_OFFSET = 2
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def tile_key(lat, lng, zoom):
+    """坐标所在的Web墨卡托瓦片，返回 "x/y"，与Leaflet的瓦片编号一致"""
+    n = 2 ** zoom
+    x, y = project(lat, lng)
+    return f"{min(n - 1, max(0, int(x * n)))}/{min(n - 1, max(0, int(y * n)))}"
+
+
+class SitePublisher:
+    """把主页面和数据发布为静态文件，由nginx等静态服务器直接提供
+
+    输出目录结构:
+        index.html                        页面（文件名固定，引用下面带哈希的文件）
+        manifest.json                     当前发布的文件列表
+        static/<名称>.<哈希>.<扩展名>          样式和脚本
+        data/points-<x>-<y>.<哈希>.json       tile_zoom级瓦片(x, y)内的景点（GeoJSON）
+        data/clusters-<z>-<x>-<y>.<哈希>.json 缩放级别z的聚类，按瓦片分文件
+    浏览器只读取可见范围内的瓦片。每个文件旁边另有预压缩的 .gz（nginx gzip_static）。
+    文件名含内容哈希，内容不变的文件不会重写；新增景点只影响所在瓦片的景点和聚类文件。
+    上一次发布的文件保留一轮，已打开旧页面的浏览器仍能取到。
+
+    render_index(static_urls, manifest) 返回页面HTML；
+    clusters(snapshot) 返回 {缩放级别: [[数量, 纬度, 经度, ...], ...]}。
+    """
+
+    def __init__(self, directory, assets, render_index, clusters, tile_zoom=12, logger=None):
+        self.directory = directory
+        self.assets = assets
+        self.render_index = render_index
+        self.clusters = clusters
+        self.tile_zoom = tile_zoom
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # 上次发布时各景点所在的瓦片，以及各瓦片的文件名
+        self._tile_of = []
+        self._tiles = {}
+        self._dirty_from = None
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data, stats):
+        """原子地写入文件和.gz版本，内容未变时跳过"""
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == data and os.path.exists(path + '.gz'):
+                    stats["unchanged"] += 1
+                    return
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for target, content in ((path, data), (path + '.gz', gzip.compress(data, 9, mtime=0))):
+            tmp = target + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, target)
+        stats["written"] += 1
+
+    def _write_hashed(self, stem, ext, data, stats):
+        """按内容哈希命名写入，已存在时跳过，返回相对路径"""
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        name = f"{stem}.{digest}.{ext}"
+        if os.path.exists(self._path(name)) and os.path.exists(self._path(name) + '.gz'):
+            stats["unchanged"] += 1
+        else:
+            self._write(name, data, stats)
+        return name
+
+    def _previous_manifest(self):
+        try:
+            with open(self._path(MANIFEST), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _files(manifest):
+        if not manifest or "points" not in manifest:
+            # 按编号分块的旧格式清单，其中的文件不再保留
+            return set()
+        files = set(manifest["points"].values()) | set(manifest["assets"].values())
+        for tiles in manifest["clusters"].values():
+            files |= set(tiles.values())
+        return files
+
+    def publish(self, snapshot, dirty_from=0):
+        """发布快照；编号小于dirty_from的景点自上次发布以来没有变化，不再重新生成"""
+        with self._lock:
+            start = time.perf_counter()
+            stats = {"written": 0, "unchanged": 0, "removed": 0}
+            previous = self._previous_manifest()
+
+            assets = {}
+            for name, source in self.assets.items():
+                stem, ext = os.path.splitext(name)
+                with open(source, 'rb') as f:
+                    assets[name] = self._write_hashed(f"static/{stem}", ext.lstrip('.'), f.read(), stats)
+
+            points = self._publish_points(snapshot, dirty_from, stats)
+
+            clusters = {}
+            for zoom, items in self.clusters(snapshot).items():
+                tiles = {}
+                tile_zoom = max(0, zoom - CLUSTER_TILE_OFFSET)
+                for item in items:
+                    tiles.setdefault(tile_key(item[1], item[2], tile_zoom), []).append(item)
+                clusters[str(zoom)] = {
+                    key: self._write_hashed(f"data/clusters-{zoom}-{key.replace('/', '-')}", 'json',
+                                            _dumps({"zoom": zoom, "clusters": tile}), stats)
+                    for key, tile in sorted(tiles.items())
+                }
+
+            manifest = {
+                "version": snapshot.version,
+                "count": len(snapshot),
+                "tile_zoom": self.tile_zoom,
+                "cluster_tile_offset": CLUSTER_TILE_OFFSET,
+                "points": points,
+                "clusters": clusters,
+                "assets": assets,
+            }
+            static_urls = dict(assets)
+            # 页面最后写入，之前引用的文件都已就绪
+            self._write(MANIFEST, _dumps(manifest), stats)
+            self._write(INDEX, self.render_index(static_urls, manifest).encode('utf-8'), stats)
+            stats["removed"] = self._cleanup(self._files(manifest) | self._files(previous))
+            stats["seconds"] = round(time.perf_counter() - start, 3)
+            self.logger.info(
+                f"静态页面已发布到 {self.directory}: 写入 {stats['written']} 个文件，"
+                f"未变 {stats['unchanged']} 个，删除 {stats['removed']} 个，用时 {stats['seconds']}s")
+            return stats
+
+    def _publish_points(self, snapshot, dirty_from, stats):
+        """按瓦片写出景点数据，只重新生成有景点变化的瓦片，返回 {"x/y": 文件名}"""
+        keep = min(dirty_from, len(self._tile_of)) if dirty_from is not None else 0
+        # 编号不小于keep的景点可能已变化，原来和现在所在的瓦片都要重新生成
+        dirty = set(self._tile_of[keep:])
+        tile_of = self._tile_of[:keep]
+        for i in range(keep, len(snapshot)):
+            key = tile_key(*snapshot[i]["location"], self.tile_zoom)
+            tile_of.append(key)
+            dirty.add(key)
+        members = {key: [] for key in dirty}
+        for i, key in enumerate(tile_of):
+            if key in members:
+                members[key].append(i)
+        tiles = {key: name for key, name in self._tiles.items() if key not in dirty}
+        for key, ids in members.items():
+            if ids:
+                data = _dumps({"type": "FeatureCollection",
+                               "features": [to_feature(snapshot[i], i) for i in ids]})
+                tiles[key] = self._write_hashed(f"data/points-{key.replace('/', '-')}", 'json', data, stats)
+        self._tile_of = tile_of
+        self._tiles = tiles
+        return dict(sorted(tiles.items()))
+
+    def _cleanup(self, keep):
+        """删除最近两次发布都没有引用的文件"""
+        removed = 0
+        for subdir in ('static', 'data'):
+            root = self._path(subdir)
+            if not os.path.isdir(root):
+                continue
+            for filename in os.listdir(root):
+                name = f"{subdir}/{filename}"
+                base = name[:-3] if name.endswith('.gz') else name
+                if base not in keep:
+                    os.remove(os.path.join(root, filename))
+                    removed += 1
+        return removed
+
+    def mark_dirty(self, first_id=0):
+        """记录编号从first_id开始的景点有变化，后台线程稍后重新发布"""
+        with self._lock:
+            self._dirty_from = first_id if self._dirty_from is None else min(self._dirty_from, first_id)
+        self._wakeup.set()
+
+    def start(self, snapshot_source, delay=2.0):
+        """启动后台发布线程，数据变化后等待delay秒合并多次修改再发布"""
+        def loop():
+            while True:
+                self._wakeup.wait()
+                time.sleep(delay)
+                self._wakeup.clear()
+                with self._lock:
+                    dirty_from, self._dirty_from = self._dirty_from, None
+                try:
+                    self.publish(snapshot_source(), dirty_from)
+                except Exception as e:
+                    self.logger.error(f"发布静态页面失败: {e}")
+                    self.mark_dirty(0)
+
+        self._thread = threading.Thread(target=loop, name="site-publisher", daemon=True)
+        self._thread.start()
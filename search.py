@@ -0,0 +1,199 @@
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+
+import numpy as np
+
+# 按空白和标点切分，片段内再取n-gram
+_SEGMENT = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """全角转半角、统一小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def segments(text):
+    return _SEGMENT.findall(normalize(text))
+
+
+def grams(text):
+    """文本中所有的单字和相邻两字，中文不需要分词"""
+    result = set()
+    for segment in segments(text):
+        result.update(segment)
+        result.update(segment[i:i + 2] for i in range(len(segment) - 1))
+    return result
+
+
+def _query_grams(term):
+    """查询词用到的n-gram：两字以上只用相邻两字，单字用单字"""
+    if len(term) == 1:
+        return [term]
+    return [term[i:i + 2] for i in range(len(term) - 1)]
+
+
+def score_text(name, description, terms):
+    """名称和描述（已normalize）对查询词的得分，缺少任一查询词时为0"""
+    score = 0
+    for term in terms:
+        if name == term:
+            score += 100
+        elif name.startswith(term):
+            score += 60
+        elif term in name:
+            score += 40
+        elif term in description:
+            score += 10
+        else:
+            return 0
+    return score
+
+
+def top_matches(matches, limit):
+    """matches为 (得分, 编号, 名称长度)，得分相同时名称短的优先"""
+    top = heapq.nsmallest(limit, matches, key=lambda m: (-m[0], m[2], m[1]))
+    return [(score, item_id) for score, item_id, _ in top]
+
+
+class SearchIndex:
+    """景点名称和描述的倒排索引
+
+    以单字和相邻两字（bigram）为词项，每个词项对应按编号递增的景点列表，
+    名称另有一份只含名称词项的列表。查询时用NumPy求各列表的交集得到候选，
+    再按名称完全相同 > 名称开头 > 名称包含 > 描述包含打分。
+    一两个字的查询词由词项列表直接确定是否包含；更长的词可能只是各bigram分散出现，
+    需要再逐个确认。插入为追加，可随新增景点增量更新。
+    """
+
+    def __init__(self):
+        self.base_version = 0
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._name_postings = {}
+        self._names = []
+        self._descriptions = []
+        self._name_lengths = array('H')
+        self._type_codes = array('H')
+        self._type_ids = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def _add(postings, keys, item_id):
+        for gram in keys:
+            items = postings.get(gram)
+            if items is None:
+                items = postings[gram] = array('I')
+            items.append(item_id)
+
+    def insert(self, item_id, name, description, type_name):
+        """插入一个景点，编号需按0,1,2...顺序递增"""
+        with self._lock:
+            if item_id != len(self._names):
+                raise ValueError(f"编号不连续: 期望{len(self._names)}，实际{item_id}")
+            name_grams = grams(name)
+            self._add(self._name_postings, name_grams, item_id)
+            self._add(self._postings, name_grams | grams(description), item_id)
+            self._type_codes.append(self._type_ids.setdefault(type_name, len(self._type_ids)))
+            name = normalize(name)
+            self._name_lengths.append(min(len(name), 0xFFFF))
+            self._descriptions.append(normalize(description))
+            self._names.append(name)
+
+    def rebuild(self, items, version=0):
+        """用 (name, description, type) 序列全量重建"""
+        fresh = SearchIndex()
+        for item_id, (name, description, type_name) in enumerate(items):
+            fresh.insert(item_id, name, description, type_name)
+        with self._lock:
+            for attr in ('_postings', '_name_postings', '_names', '_descriptions',
+                         '_name_lengths', '_type_codes', '_type_ids'):
+                setattr(self, attr, getattr(fresh, attr))
+            self.base_version = version
+
+    def _gather(self, terms, types, count):
+        """在锁内复制查询要用的数据，之后的计算不受并发插入影响"""
+        with self._lock:
+            count = min(count, len(self._names))
+            lists = []
+            name_lists = []
+            for term in terms:
+                keys = _query_grams(term)
+                postings = [self._postings.get(gram) for gram in keys]
+                if not all(postings):
+                    return None
+                lists.extend(np.array(p, dtype=np.int64) for p in postings)
+                name_lists.append([np.array(self._name_postings.get(gram, ()), dtype=np.int64)
+                                   for gram in keys])
+            type_codes = None
+            if types:
+                type_codes = np.array([self._type_ids[t] for t in types if t in self._type_ids],
+                                      dtype=np.int64)
+            return (count, lists, name_lists, type_codes, self._names, self._descriptions,
+                    np.array(self._name_lengths[:count]), np.array(self._type_codes[:count]))
+
+    def search(self, query, types=None, limit=20, count=None):
+        """返回 (匹配总数, [(得分, 编号), ...])，按得分从高到低
+
+        types为允许的类型集合；count为快照长度，之后新增的景点不返回。
+        """
+        terms = segments(query)
+        if not terms:
+            return 0, []
+        gathered = self._gather(terms, types, len(self._names) if count is None else count)
+        if gathered is None:
+            return 0, []
+        count, lists, name_lists, type_codes, names, descriptions, name_lengths, item_types = gathered
+
+        lists.sort(key=len)
+        candidates = lists[0][lists[0] < count]
+        for postings in lists[1:]:
+            candidates = np.intersect1d(candidates, postings, assume_unique=True)
+        if type_codes is not None:
+            candidates = candidates[np.isin(item_types[candidates], type_codes)]
+
+        scores = np.zeros(len(candidates), dtype=np.int64)
+        valid = np.ones(len(candidates), dtype=bool)
+        for term, term_name_lists in zip(terms, name_lists):
+            in_name = np.ones(len(candidates), dtype=bool)
+            for postings in term_name_lists:
+                in_name &= np.isin(candidates, postings, assume_unique=True)
+            term_scores = np.where(in_name, 40, 10)
+            for pos in np.flatnonzero(in_name):
+                name = names[candidates[pos]]
+                if name == term:
+                    term_scores[pos] = 100
+                elif name.startswith(term):
+                    term_scores[pos] = 60
+                elif len(term) > 2 and term not in name:
+                    term_scores[pos] = 10
+            if len(term) > 2:
+                # 各bigram都出现不代表整个词连续出现
+                for pos in np.flatnonzero(term_scores == 10):
+                    if term not in descriptions[candidates[pos]]:
+                        valid[pos] = False
+            scores += term_scores
+
+        candidates, scores = candidates[valid], scores[valid]
+        order = np.lexsort((candidates, name_lengths[candidates], -scores))[:limit]
+        return len(candidates), [(int(scores[i]), int(candidates[i])) for i in order]
+
+
+def linear_search(locations, query, types=None, limit=20):
+    """不使用索引逐个比较，快照早于索引重建时使用"""
+    terms = segments(query)
+    if not terms:
+        return 0, []
+    matches = []
+    for item_id, loc in enumerate(locations):
+        if types and loc["type"] not in types:
+            continue
+        name = normalize(loc["name"])
+        score = score_text(name, normalize(loc.get("description", "")), terms)
+        if score:
+            matches.append((score, item_id, len(name)))
+    return len(matches), top_matches(matches, limit)
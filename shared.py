@@ -0,0 +1,147 @@
+import fcntl
+import json
+import mmap
+import os
+import threading
+
+from columnar import LocationTable
+
+
+class FileLock:
+    """跨进程的写锁（fcntl.flock），同一进程内可重入
+
+    同一份数据的所有进程（多个工作进程、命令行导入）使用同一个锁文件，
+    修改存储或从存储重新加载时持有，避免读到其他进程还没写完的内容。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mutex = threading.RLock()
+        self._file = None
+        self._depth = 0
+
+    def acquire(self, blocking=True):
+        """加锁，blocking为False时锁被占用立即返回False"""
+        if not self._mutex.acquire(blocking):
+            return False
+        if self._depth == 0:
+            f = open(self.path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BaseException as e:
+                f.close()
+                self._mutex.release()
+                if isinstance(e, BlockingIOError):
+                    # 其他进程持有锁
+                    return False
+                raise
+            self._file = f
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._mutex.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SharedSnapshot:
+    """多个进程共享的景点快照文件
+
+    写入方把列式表写到临时文件后原子替换，读取方用mmap映射文件，
+    各列直接引用映射的内存，多个进程共用操作系统的同一份页缓存。
+    文件替换后（inode变化）读取方重新映射，已发出的快照仍引用旧的映射，不受影响。
+    只追加少量景点时不重写整个文件，而是写到meta["delta"]对应的增量文件末尾，
+    读取方从上次读到的位置继续读；重写快照文件时换用新的增量文件。
+    修改存储和快照文件的进程需持有lock()，保证同一时刻只有一个写入方。
+    """
+
+    def __init__(self, path, delta_rows=1000, lock=None):
+        self.path = path
+        # 增量文件中的景点超过该数量、且超过快照文件的一半时，重写快照文件
+        self.delta_rows = delta_rows
+        self.file_lock = lock or FileLock(f"{path}.lock")
+        self._stat = None
+
+    def lock(self):
+        """跨进程的写锁，同一进程内可重入"""
+        return self.file_lock
+
+    @staticmethod
+    def _key(st):
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def changed(self):
+        """文件是否在上次读取或写入后被替换"""
+        try:
+            return self._key(os.stat(self.path)) != self._stat
+        except OSError:
+            return False
+
+    def read(self):
+        """映射当前的快照文件，返回 (只读表, meta)；文件不存在时返回None"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            # 以打开的文件为准，避免stat和open之间文件被替换
+            st = os.fstat(f.fileno())
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        table, meta = LocationTable.from_buffer(mapped)
+        self._stat = self._key(st)
+        return table, meta
+
+    def write(self, table, meta, previous=None):
+        """写出新的快照文件并原子替换，调用方需持有lock()
+
+        previous为被替换文件的meta，其增量文件的内容已包含在新文件中，随后删除。
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            table.dump(f, meta)
+        os.replace(tmp_path, self.path)
+        if previous is not None and previous.get("delta"):
+            try:
+                os.remove(self.delta_path(previous))
+            except FileNotFoundError:
+                pass
+
+    def delta_path(self, meta):
+        return f"{self.path}.{meta['delta']}.delta"
+
+    def append_delta(self, meta, locations, signature):
+        """把追加的景点写到增量文件末尾，返回写完后的文件位置，调用方需持有lock()"""
+        record = {"signature": signature, "locations": [dict(loc) for loc in locations]}
+        with open(self.delta_path(meta), 'ab') as f:
+            f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            return f.tell()
+
+    def read_delta(self, meta, offset):
+        """读取增量文件offset之后完整写入的记录，返回 ([记录], 新的位置)"""
+        records = []
+        if not meta.get("delta"):
+            return records, offset
+        try:
+            f = open(self.delta_path(meta), 'rb')
+        except FileNotFoundError:
+            # 还没有增量，或快照文件已被替换（之后重新映射时读取新文件）
+            return records, offset
+        with f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                records.append(json.loads(raw))
+                offset += len(raw)
+        return records, offset
@@ -0,0 +1,245 @@
+import heapq
+import math
+import threading
+
+import numpy as np
+
+from geo import EARTH_RADIUS_M, haversine_m, haversine_columns
+
+# 每度纬度对应的距离（米）
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+
+class GridIndex:
+    """景点坐标的网格空间索引
+
+    按固定经纬度间隔把平面划分为网格，每个网格记录落在其中的景点编号。
+    范围查询只检查与范围相交的网格；最近邻查询从所在网格向外逐圈扩展，
+    当外圈可能的最短距离已经超过当前第k近的距离时停止。
+    插入为O(1)，可随新增景点增量更新。
+    """
+
+    def __init__(self, cell_size=0.02, max_rings=64):
+        self.cell_size = cell_size
+        self.max_rings = max_rings
+        self.base_version = 0
+        self._lock = threading.RLock()
+        self._cells = {}
+        self._lats = []
+        self._lngs = []
+        self._bounds = None
+
+    def __len__(self):
+        return len(self._lats)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def insert(self, item_id, lat, lng):
+        """插入一个点，编号需按0,1,2...顺序递增"""
+        with self._lock:
+            if item_id != len(self._lats):
+                raise ValueError(f"编号不连续: 期望{len(self._lats)}，实际{item_id}")
+            self._lats.append(lat)
+            self._lngs.append(lng)
+            key = self._cell(lat, lng)
+            self._cells.setdefault(key, []).append(item_id)
+            if self._bounds is None:
+                self._bounds = [key[0], key[0], key[1], key[1]]
+            else:
+                b = self._bounds
+                b[0] = min(b[0], key[0])
+                b[1] = max(b[1], key[0])
+                b[2] = min(b[2], key[1])
+                b[3] = max(b[3], key[1])
+
+    def rebuild(self, points, version=0):
+        """用 (lat, lng) 序列全量重建"""
+        fresh = GridIndex(self.cell_size, self.max_rings)
+        for item_id, (lat, lng) in enumerate(points):
+            fresh.insert(item_id, lat, lng)
+        with self._lock:
+            self._cells = fresh._cells
+            self._lats = fresh._lats
+            self._lngs = fresh._lngs
+            self._bounds = fresh._bounds
+            self.base_version = version
+
+    def _cells_in(self, i0, i1, j0, j1):
+        """范围内的非空网格"""
+        if (i1 - i0 + 1) * (j1 - j0 + 1) <= len(self._cells):
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    ids = self._cells.get((i, j))
+                    if ids:
+                        yield (i, j), ids
+        else:
+            # 范围比已有数据还大时，直接遍历非空网格更快
+            for key, ids in self._cells.items():
+                if i0 <= key[0] <= i1 and j0 <= key[1] <= j1:
+                    yield key, ids
+
+    def bbox(self, south, west, north, east):
+        """范围查询，返回编号列表（升序）"""
+        i0, j0 = self._cell(south, west)
+        i1, j1 = self._cell(north, east)
+        cs = self.cell_size
+        result = []
+        with self._lock:
+            lats, lngs = self._lats, self._lngs
+            for (i, j), ids in self._cells_in(i0, i1, j0, j1):
+                if (south <= i * cs and (i + 1) * cs <= north
+                        and west <= j * cs and (j + 1) * cs <= east):
+                    # 网格完全在范围内，无需逐点判断
+                    result.extend(ids)
+                else:
+                    result.extend(k for k in ids
+                                  if south <= lats[k] <= north and west <= lngs[k] <= east)
+        result.sort()
+        return result
+
+    def radius(self, lat, lng, meters):
+        """半径查询，返回按距离排序的 [(距离, 编号)]"""
+        dlat = meters / METERS_PER_DEGREE
+        dlng = dlat / max(math.cos(math.radians(min(89.9, abs(lat) + dlat))), 1e-6)
+        i0, j0 = self._cell(lat - dlat, lng - dlng)
+        i1, j1 = self._cell(lat + dlat, lng + dlng)
+        result = []
+        with self._lock:
+            lats, lngs = self._lats, self._lngs
+            for _, ids in self._cells_in(i0, i1, j0, j1):
+                for k in ids:
+                    d = haversine_m(lat, lng, lats[k], lngs[k])
+                    if d <= meters:
+                        result.append((d, k))
+        result.sort()
+        return result
+
+    def _ring(self, ci, cj, r):
+        """与中心网格切比雪夫距离为r的一圈网格"""
+        if r == 0:
+            yield (ci, cj)
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def nearest(self, lat, lng, k, max_distance=None):
+        """k近邻查询，返回按距离排序的 [(距离, 编号)]
+
+        需要查到max_rings圈以外时返回None（查询点离数据很远或附近的点太少），
+        由调用方改用CoordinateColumns逐点计算，避免逐圈检查大量空网格。
+        """
+        if k <= 0:
+            return []
+        ci, cj = self._cell(lat, lng)
+        cs = self.cell_size
+        with self._lock:
+            if self._bounds is None:
+                return []
+            # 只在锁内取出引用：插入只追加，重建会换成新对象，搜索过程不会读到不一致的数据
+            cells, lats, lngs = self._cells, self._lats, self._lngs
+            i_min, i_max, j_min, j_max = self._bounds
+
+        # 比数据范围更近的圈都是空的，从数据范围的边缘开始
+        r = max(0, i_min - ci, ci - i_max, j_min - cj, cj - j_max)
+        max_r = max(abs(ci - i_min), abs(ci - i_max), abs(cj - j_min), abs(cj - j_max))
+        # 经度差造成的距离按查询点和数据中纬度绝对值最大处的余弦收缩，与圈数无关
+        data_lat = min(90.0, max(abs(i_min * cs), abs((i_max + 1) * cs)))
+        lng_scale = math.sqrt(max(0.0, math.cos(math.radians(lat)) * math.cos(math.radians(data_lat))))
+        heap = []
+        while r <= max_r:
+            if r > self.max_rings:
+                return None
+            for key in self._ring(ci, cj, r):
+                for item_id in cells.get(key, ()):
+                    d = haversine_m(lat, lng, lats[item_id], lngs[item_id])
+                    if max_distance is not None and d > max_distance:
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, -item_id))
+                    elif -d > heap[0][0]:
+                        heapq.heapreplace(heap, (-d, -item_id))
+            # 外圈的点与查询点在纬度或经度方向至少相隔r个网格：纬度差直接是距离的下界，
+            # 经度差按半正矢公式 sin²(d/2) ≥ cosφ1·cosφ2·sin²(Δλ/2) 换算
+            gap = math.radians(r * cs)
+            lower_bound = min(gap, 2 * math.asin(min(1.0, lng_scale * math.sin(min(gap, math.pi) / 2))))
+            lower_bound *= EARTH_RADIUS_M * 0.99
+            if len(heap) == k and -heap[0][0] <= lower_bound:
+                break
+            if max_distance is not None and lower_bound > max_distance:
+                break
+            r += 1
+        return sorted((-d, -item_id) for d, item_id in heap)
+
+
+class CoordinateColumns:
+    """全部景点坐标的NumPy列式副本，用于向量化的距离计算
+
+    保存弧度形式的经纬度和纬度余弦，距离计算时不必重复换算。
+    数组按倍数预留容量，新增景点时原地追加；读取时按快照长度切片，
+    扩容会换成新数组，已经取出的切片不受影响。
+    """
+
+    def __init__(self, capacity=1024):
+        self.base_version = 0
+        self._lock = threading.Lock()
+        self._columns = np.empty((3, capacity))
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, lat, lng):
+        """追加一个点"""
+        with self._lock:
+            if self._size == self._columns.shape[1]:
+                columns = np.empty((3, max(1024, self._size * 2)))
+                columns[:, :self._size] = self._columns[:, :self._size]
+                self._columns = columns
+            rad_lat = math.radians(lat)
+            self._columns[:, self._size] = (rad_lat, math.radians(lng), math.cos(rad_lat))
+            self._size += 1
+
+    def rebuild(self, points, version=0):
+        """用 (lat, lng) 序列全量重建"""
+        coords = np.radians(np.array(list(points), dtype=float).reshape(-1, 2))
+        columns = np.empty((3, max(1024, len(coords))))
+        columns[0, :len(coords)] = coords[:, 0]
+        columns[1, :len(coords)] = coords[:, 1]
+        columns[2, :len(coords)] = np.cos(coords[:, 0])
+        with self._lock:
+            self._columns = columns
+            self._size = len(coords)
+            self.base_version = version
+
+    def view(self, count=None):
+        """前count个点的 (纬度弧度, 经度弧度, 纬度余弦) 数组"""
+        with self._lock:
+            count = self._size if count is None else min(count, self._size)
+            return self._columns[:, :count]
+
+    def nearby(self, lat, lng, radius=None, k=None, count=None):
+        """半径/最近邻查询，返回按距离排序的 (编号数组, 距离数组)"""
+        rad_lats, rad_lngs, cos_lats = self.view(count)
+        ids = None
+        if radius is not None:
+            # 先按纬度差粗筛，只对候选点计算三角函数
+            dlat = radius / EARTH_RADIUS_M
+            ids = np.flatnonzero(np.abs(rad_lats - math.radians(lat)) <= dlat)
+            rad_lats, rad_lngs, cos_lats = rad_lats[ids], rad_lngs[ids], cos_lats[ids]
+
+        dist = haversine_columns(lat, lng, rad_lats, rad_lngs, cos_lats)
+        if ids is None:
+            ids = np.arange(len(dist))
+        if radius is not None:
+            keep = dist <= radius
+            ids, dist = ids[keep], dist[keep]
+        if k is not None and k < len(dist):
+            part = np.argpartition(dist, k)[:k]
+            ids, dist = ids[part], dist[part]
+        order = np.lexsort((ids, dist))
+        return ids[order], dist[order]
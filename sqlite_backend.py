@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_locations_type ON locations(type);
+CREATE INDEX IF NOT EXISTS idx_locations_coords ON locations(lat, lng);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);
+
+-- 任何修改都递增版本号，外部工具改动数据库也能被发现
+CREATE TRIGGER IF NOT EXISTS locations_ai AFTER INSERT ON locations
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'revision'; END;
+CREATE TRIGGER IF NOT EXISTS locations_au AFTER UPDATE ON locations
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'revision'; END;
+CREATE TRIGGER IF NOT EXISTS locations_ad AFTER DELETE ON locations
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'revision'; END;
+'''
+
+INSERT_SQL = 'INSERT INTO locations (name, lat, lng, type, description) VALUES (?, ?, ?, ?, ?)'
+
+
+def _row(loc):
+    lat, lng = loc["location"]
+    return (loc["name"], float(lat), float(lng), loc["type"], loc.get("description", ""))
+
+
+class SQLiteBackend:
+    """SQLite存储
+
+    使用WAL日志模式，读写互不阻塞；连接池大小与Waitress线程数一致。
+    新增景点只插入一行，不再重写全部数据。
+    """
+
+    def __init__(self, path, pool_size=4, import_path=None, defaults=(), logger=None):
+        self.path = path
+        self.pool_size = pool_size
+        self.import_path = import_path
+        self.defaults = list(defaults)
+        self.logger = logger or logging.getLogger(__name__)
+        self._reset_pool()
+        # SQLite连接不能跨进程使用，fork出的子进程重新建立连接
+        os.register_at_fork(after_in_child=self._reset_pool)
+
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+
+    def _reset_pool(self):
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        for _ in range(self.pool_size):
+            self._pool.put(None)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """从连接池借用连接，按需创建"""
+        conn = self._pool.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        except sqlite3.DatabaseError:
+            # 出错的连接直接丢弃，下次重新创建
+            if conn is not None:
+                conn.close()
+            conn = None
+            raise
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """写事务"""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _migrate(self, conn):
+        """首次启动时从JSON文件或预设数据导入，只执行一次"""
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            return
+        if self.import_path and os.path.exists(self.import_path):
+            with open(self.import_path, 'r', encoding='utf-8') as f:
+                locations = json.load(f)
+            source = self.import_path
+        else:
+            locations = self.defaults
+            source = "预设数据"
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                conn.executemany(INSERT_SQL, [_row(loc) for loc in locations])
+                conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', 1)")
+                self.logger.info(f"从 {source} 迁移 {len(locations)} 个景点到 {self.path}")
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def signature(self):
+        """数据库版本号，由触发器在每次修改时递增"""
+        with self.connection() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def load(self):
+        """读取全部景点"""
+        with self.connection() as conn:
+            rows = conn.execute(
+                'SELECT name, lat, lng, type, description FROM locations ORDER BY id')
+            return [{"name": name, "location": [lat, lng], "type": type_, "description": description}
+                    for name, lat, lng, type_, description in rows]
+
+    def append(self, new_locations, all_locations):
+        """插入新景点"""
+        with self.transaction() as conn:
+            conn.executemany(INSERT_SQL, [_row(loc) for loc in new_locations])
+
+    def begin_bulk(self, existing):
+        """开始批量追加，所有记录在同一个事务中提交"""
+        return _SQLiteBulkWriter(self)
+
+    def save_all(self, locations):
+        """整体替换全部景点"""
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM locations')
+            conn.executemany(INSERT_SQL, [_row(loc) for loc in locations])
+
+    def close(self):
+        """关闭连接池中的连接"""
+        for _ in range(self.pool_size):
+            conn = self._pool.get()
+            if conn is not None:
+                conn.close()
+
+
+class _SQLiteBulkWriter:
+    """批量导入：整个导入过程占用一个连接和一个写事务"""
+
+    def __init__(self, backend):
+        self._context = backend.transaction()
+        self._conn = self._context.__enter__()
+
+    def write(self, locations):
+        self._conn.executemany(INSERT_SQL, [_row(loc) for loc in locations])
+
+    def commit(self):
+        self._context.__exit__(None, None, None)
+
+    def abort(self):
+        error = RuntimeError("批量导入已取消")
+        self._context.__exit__(type(error), error, None)
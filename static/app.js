@@ -0,0 +1,84 @@
+function validateForm() {
+    const lat = parseFloat(document.getElementById('lat').value);
+    const lng = parseFloat(document.getElementById('lng').value);
+
+    if (lat < 20 || lat > 25 || lng < 110 || lng > 117) {
+        alert('请输入有效的澳门/广东地区坐标（纬度20-25，经度110-117）');
+        return false;
+    }
+    return true;
+}
+
+let liveSource = null;
+
+function forwardToMap(type, data) {
+    // 地图在iframe中，由地图内的LiveMarkerLayer负责添加标记
+    const frame = document.querySelector('#map-container iframe');
+    if (frame && frame.contentWindow) {
+        frame.contentWindow.postMessage({liveUpdate: type, data: data}, '*');
+    }
+}
+
+function startLiveUpdates() {
+    const body = document.body;
+    let url = body.dataset.liveUrl;
+    if (!url && body.dataset.livePort) {
+        url = location.protocol + '//' + location.hostname + ':' + body.dataset.livePort + '/events';
+    }
+    if (!url || !window.EventSource) {
+        return;
+    }
+    liveSource = new EventSource(url);
+    ['locations', 'reload'].forEach(function(type) {
+        liveSource.addEventListener(type, function(e) {
+            forwardToMap(type, JSON.parse(e.data));
+        });
+    });
+}
+
+function showMessage(text, type) {
+    const box = document.getElementById('form-message');
+    box.textContent = text;
+    box.className = 'message ' + type;
+    box.hidden = false;
+}
+
+function submitLocation(e) {
+    e.preventDefault();
+    const form = e.target;
+    if (!validateForm()) {
+        return;
+    }
+    fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: {'Accept': 'application/json'}
+    })
+        .then(function(resp) {
+            return resp.json().then(function(data) { return {ok: resp.ok, data: data}; });
+        })
+        .then(function(result) {
+            if (!result.ok) {
+                showMessage(result.data.error, 'error');
+                return;
+            }
+            if (!liveSource || liveSource.readyState !== EventSource.OPEN) {
+                // 没有实时更新连接时只能刷新页面
+                window.location.href = '/';
+                return;
+            }
+            form.reset();
+            showMessage(result.data.message, 'success');
+            document.getElementById('name').focus();
+        })
+        .catch(function() {
+            // 脚本提交失败时退回普通表单提交
+            form.submit();
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.getElementById('name').focus();
+    document.querySelector('form[action="/add_location"]').addEventListener('submit', submitLocation);
+    startLiveUpdates();
+});
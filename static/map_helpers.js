@@ -0,0 +1,35 @@
+// 地图内各脚本共用的函数，由map_elements.py内联到地图页面一次
+var mapHelpers = (function() {
+    function escapeHtml(text) {
+        return String(text == null ? '' : text).replace(/[&<>"']/g, function(c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+        });
+    }
+
+    function makeIcon(iconConfig, type) {
+        var config = iconConfig[type] || iconConfig['其他'];
+        return L.AwesomeMarkers.icon({
+            icon: config.icon, markerColor: config.color,
+            iconColor: 'white', prefix: 'glyphicon'
+        });
+    }
+
+    function clusterIcon(count) {
+        var size = count < 100 ? 32 : (count < 10000 ? 40 : 48);
+        return L.divIcon({
+            className: '',
+            iconSize: [size, size],
+            html: '<div style="width:' + size + 'px;height:' + size + 'px;line-height:' + size +
+                'px;border-radius:50%;background:rgba(102,126,234,0.85);color:white;' +
+                'text-align:center;font:bold 12px Arial;box-shadow:0 0 0 4px rgba(102,126,234,0.3);">' +
+                count + '</div>'
+        });
+    }
+
+    function popupHtml(p) {
+        return '<b>' + escapeHtml(p.name) + '</b><br>类型: ' +
+            escapeHtml(p.type) + '<br>描述: ' + escapeHtml(p.description);
+    }
+
+    return {escapeHtml: escapeHtml, makeIcon: makeIcon, clusterIcon: clusterIcon, popupHtml: popupHtml};
+})();
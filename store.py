@@ -0,0 +1,484 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import ExitStack
+from itertools import chain
+
+from columnar import ChainedTable, LocationTable, Snapshot
+
+
+def fsync_dir(path):
+    """同步目录项，保证重命名在断电后仍然有效"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """先写临时文件并fsync，再原子替换目标文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+
+class AtomicJsonListWriter:
+    """分批写出JSON数组到临时文件，提交时fsync并原子替换目标文件"""
+
+    def __init__(self, path, initial=()):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._first = True
+        self._file.write('[')
+        self.write(initial)
+
+    def write(self, items):
+        f = self._file
+        for item in items:
+            f.write('\n' if self._first else ',\n')
+            self._first = False
+            f.write('    ' + json.dumps(dict(item), ensure_ascii=False, indent=4).replace('\n', '\n    '))
+
+    def commit(self):
+        self._file.write(']' if self._first else '\n]')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        fsync_dir(self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.tmp_path)
+
+
+class JsonFileBackend:
+    """JSON文件存储，每次保存重写整个文件"""
+
+    def __init__(self, path, defaults=()):
+        self.path = path
+        self.defaults = list(defaults)
+
+    def signature(self):
+        """文件的修改时间和大小，用于发现外部修改"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        """读取全部景点"""
+        if not os.path.exists(self.path):
+            return list(self.defaults)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_all(self, locations):
+        """写入全部景点，写临时文件后原子替换，中途崩溃不会留下半个文件"""
+        writer = AtomicJsonListWriter(self.path, locations)
+        writer.commit()
+
+    def append(self, new_locations, all_locations):
+        """追加景点，JSON文件只能整体重写"""
+        self.save_all(all_locations)
+
+    def begin_bulk(self, existing):
+        """开始批量追加：先写出已有景点，之后逐批写入新景点，提交时一次替换"""
+        return AtomicJsonListWriter(self.path, existing)
+
+
+class LocationStore:
+    """常驻内存的景点数据
+
+    启动后只从后端读取一次，之后的读取都直接返回内存中的只读快照；
+    后端文件的修改时间或大小变化时（例如被外部编辑）才重新加载。
+    数据以列式表保存（见columnar.LocationTable），新增景点直接追加到表中，
+    已发出的快照长度不变，不会看到之后的写入。
+
+    新增景点统一由一个写线程提交：短时间窗口内到达的插入合并为一批，
+    一次写入后端，每个请求等待所在批次提交完成后返回。
+
+    shared为SharedSnapshot时用于多进程：快照保存在共享的映射文件中，
+    写入方持有跨进程的写锁，写完存储后把新增景点写到增量文件，或生成新文件替换；
+    其他进程读取增量或重新映射，只是追加时按新增景点增量通知回调。
+    单进程时也可以传入lock（shared.FileLock），与命令行导入等其他进程互斥。
+    """
+
+    def __init__(self, backend, check_interval=1.0, commit_window=0.005,
+                 max_batch=1000, categories=(), logger=None, shared=None, lock=None):
+        self.backend = backend
+        self.categories = list(categories)
+        self.check_interval = check_interval
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._signature = None
+        self._last_check = 0.0
+        self._version = 0
+        self._generation = None
+        self._queue = queue.Queue()
+        self._writer = None
+        self._listeners = []
+        self.shared = shared
+        # 跨进程的写锁（shared.FileLock）：写入和重新加载时持有，多进程时使用共享快照的锁
+        self.file_lock = shared.lock() if shared is not None else lock
+        self._shared_meta = None
+        self._delta_offset = 0
+
+    def add_listener(self, callback):
+        """注册数据变化回调 callback(snapshot, added)
+
+        added为本次新增的景点（位于快照末尾）；整体重新加载或替换时为None，需要全量重建。
+        回调在写锁内、新快照对外可见之前调用，用于增量维护各种索引。
+        """
+        self._listeners.append(callback)
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def snapshot(self):
+        """获取当前快照，必要时检查后端是否被外部修改"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                self._refresh()
+                return self._snapshot
+        if time.monotonic() - self._last_check >= self.check_interval:
+            # 正在写入（例如批量导入，可能在其他进程中）时不等待，先返回当前快照
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._refresh(blocking=False)
+                    snapshot = self._snapshot
+                finally:
+                    self._lock.release()
+        return snapshot
+
+    def _exclusive(self):
+        """写入时持有的锁：本进程的写锁，再加跨进程的写锁"""
+        stack = ExitStack()
+        stack.enter_context(self._lock)
+        if self.file_lock is not None:
+            stack.enter_context(self.file_lock)
+        return stack
+
+    def _refresh(self, blocking=True):
+        """后端有变化时重新加载，调用方需持有锁
+
+        重新加载时持有跨进程的写锁，不会读到其他进程写了一半的内容（例如命令行导入
+        未提交的部分）；blocking为False时锁被占用就跳过，稍后再检查。
+        """
+        self._last_check = time.monotonic()
+        if self.shared is not None:
+            self._refresh_shared(blocking)
+            return
+        if self._snapshot is not None and self.backend.signature() == self._signature:
+            return
+        if self.file_lock is None:
+            self._reload()
+            return
+        if not self.file_lock.acquire(blocking or self._snapshot is None):
+            return
+        try:
+            # 等锁期间可能已经由写入方更新
+            if self._snapshot is None or self.backend.signature() != self._signature:
+                self._reload()
+        finally:
+            self.file_lock.release()
+
+    def _reload(self):
+        """从后端重新加载全部景点"""
+        try:
+            locations = self.backend.load()
+        except Exception as e:
+            self.logger.error(f"加载位置数据错误: {e}")
+            if self._snapshot is None:
+                self._publish(self.backend.defaults)
+            return
+        self._signature = self.backend.signature()
+        self._publish(locations)
+        self.logger.info(f"已从存储加载 {len(locations)} 个景点")
+
+    def _shared_signature(self):
+        return json.dumps(self.backend.signature())
+
+    def _shared_in_sync(self):
+        return self._shared_meta is not None and self._shared_signature() == self._shared_meta["signature"]
+
+    def _refresh_shared(self, blocking=True):
+        """多进程模式的检查，调用方需持有锁
+
+        读取其他进程写出的快照文件和增量；存储与快照记录的版本不一致时
+        （被外部修改，或本进程的后端状态落后）在跨进程写锁内先让后端增量追上
+        （后端提供sync()时，例如日志存储），不能增量追上时再重新加载，
+        确实被外部修改时重建快照文件。
+        """
+        self._adopt_changes()
+        if self._shared_in_sync():
+            return
+        if not self.file_lock.acquire(blocking or self._snapshot is None):
+            return
+        try:
+            self._sync_shared()
+        finally:
+            self.file_lock.release()
+
+    def _sync_shared(self):
+        """在跨进程写锁内让存储和共享快照一致"""
+        # 等锁期间其他进程可能已写完
+        self._adopt_changes()
+        if self._shared_in_sync():
+            return
+        sync = getattr(self.backend, 'sync', None)
+        added = sync() if sync is not None and self._snapshot is not None else None
+        if added is not None:
+            self._signature = self.backend.signature()
+            if self._shared_in_sync():
+                return
+            if added:
+                # 存储中有快照还没有的记录（例如写入方在共享前退出），补到快照中
+                self._publish(None, added)
+                return
+        try:
+            # 日志存储等有进程内状态的后端，在其他进程写入后也需重新加载
+            locations = self.backend.load()
+        except Exception as e:
+            self.logger.error(f"加载位置数据错误: {e}")
+            if self._snapshot is None:
+                self._publish(self.backend.defaults)
+            return
+        self._signature = self.backend.signature()
+        if self._shared_in_sync():
+            return
+        self._publish(locations)
+        self.logger.info(f"已从存储加载 {len(locations)} 个景点，写入共享快照 {self.shared.path}")
+
+    def _adopt_changes(self):
+        """快照文件被替换时重新映射，再读取增量文件中新增的景点"""
+        if self._snapshot is None or self.shared.changed():
+            self._adopt_shared()
+        if self._shared_meta is not None:
+            self._adopt_delta()
+
+    def _adopt_shared(self):
+        """映射其他进程写出的快照文件，同一份数据追加的部分增量通知回调"""
+        mapped = self.shared.read()
+        if mapped is None:
+            return
+        table, meta = mapped
+        table = ChainedTable(table)
+        old = self._snapshot
+        same = (old is not None and self._shared_meta is not None
+                and meta["generation"] == self._shared_meta["generation"] and len(old) <= len(table))
+        self._shared_meta = meta
+        self._generation = meta["generation"]
+        self._delta_offset = 0
+        if same and len(old) == len(table):
+            # 只是把增量合并进了新文件，数据没有变化，换用新的映射即可
+            self._snapshot = Snapshot(table, old.version, generation=self._generation)
+            return
+        added = None
+        if same:
+            added = Snapshot(table, 0)[len(old):]
+            if len(added) > len(old):
+                added = None
+        self._version += 1
+        self._notify(self._new_snapshot(table), added)
+
+    def _adopt_delta(self):
+        """读取其他进程写到增量文件的景点，追加到当前表末尾"""
+        records, self._delta_offset = self.shared.read_delta(self._shared_meta, self._delta_offset)
+        if not records:
+            return
+        self._shared_meta = {**self._shared_meta, "signature": records[-1]["signature"]}
+        old_count = len(self._snapshot)
+        table = self._extend(loc for record in records for loc in record["locations"])
+        added = Snapshot(table, 0)[old_count:]
+        self._version += 1
+        self._notify(self._new_snapshot(table), None if len(added) > old_count else added)
+
+    def _share(self, table, appended, added=None):
+        """把新数据写到共享快照，返回之后使用的表，调用方需持有跨进程写锁
+
+        appended表示新表只是在原有数据后追加，其他进程可以增量更新；
+        此时added（本次新增的景点）不多就只写到增量文件末尾，
+        否则写出完整的快照文件并改用映射的只读表。
+        """
+        meta = self._shared_meta
+        signature = self._shared_signature()
+        if (appended and added is not None and meta is not None and meta.get("delta")
+                and isinstance(table, ChainedTable)
+                and len(table.tail) <= max(self.shared.delta_rows, len(table.base) // 2)):
+            self._delta_offset = self.shared.append_delta(meta, added, signature)
+            self._shared_meta = {**meta, "signature": signature}
+            return table
+        if isinstance(table, ChainedTable):
+            table = table.merged()
+        new_meta = {
+            "generation": meta["generation"] if appended and meta else uuid.uuid4().hex,
+            "signature": signature,
+            # 新文件使用新的增量文件，旧的增量已合并进来
+            "delta": uuid.uuid4().hex,
+        }
+        self.shared.write(table, new_meta, meta)
+        table, self._shared_meta = self.shared.read()
+        self._generation = self._shared_meta["generation"]
+        self._delta_offset = 0
+        return ChainedTable(table)
+
+    def _extend(self, added):
+        """把added追加到当前表末尾；多进程时追加到映射表后面的尾部表，不复制映射的部分"""
+        table = self._snapshot.table
+        for loc in added:
+            table.append(loc)
+        return table
+
+    def _publish(self, locations, added=None):
+        """生成新版本的快照，调用方需持有锁
+
+        added为None时用locations重建整张表，否则把added追加到当前表末尾。
+        """
+        if added is None:
+            table = LocationTable.from_locations(locations, self.categories)
+        else:
+            table = self._extend(added)
+        self._announce(table, added)
+
+    def _announce(self, table, added, appended=None):
+        """通知各回调并发布新快照，调用方需持有锁
+
+        多进程时先写出共享快照文件；appended表示只是追加，默认为added不是None。
+        """
+        appended = added is not None if appended is None else appended
+        if self.shared is not None:
+            table = self._share(table, appended, added)
+        elif not appended:
+            self._generation = uuid.uuid4().hex
+        self._version += 1
+        self._notify(self._new_snapshot(table), added)
+
+    def _new_snapshot(self, table):
+        return Snapshot(table, self._version, generation=self._generation)
+
+    def _notify(self, snapshot, added):
+        """通知各回调后发布快照"""
+        for callback in self._listeners:
+            try:
+                callback(snapshot, added)
+            except Exception as e:
+                self.logger.error(f"数据变化回调错误: {e}")
+        self._snapshot = snapshot
+
+    def import_batches(self, batches):
+        """批量追加景点，batches逐批产出景点列表，全部写完后一次提交
+
+        导入期间持有写锁，普通插入会排队等待；读取不受影响。
+        返回新增的数量。
+        """
+        with self._exclusive():
+            self._refresh()
+            # 新景点先放在临时的列式表中，提交成功后再并入
+            staging = LocationTable(self.categories)
+            bulk = self.backend.begin_bulk(self._snapshot)
+            try:
+                for batch in batches:
+                    bulk.write(batch)
+                    for loc in batch:
+                        staging.append(loc)
+            except BaseException:
+                bulk.abort()
+                raise
+            bulk.commit()
+            self._signature = self.backend.signature()
+            if not len(staging):
+                return 0
+
+            old_count = len(self._snapshot)
+            added = list(Snapshot(staging, 0))
+            table = self._extend(added)
+            # 新增数量超过原有数据时，各索引全量重建比逐个插入更快
+            self._announce(table, None if len(staging) > old_count else added, appended=True)
+            return len(staging)
+
+    def replace(self, locations):
+        """整体替换全部景点"""
+        with self._exclusive():
+            self.backend.save_all(locations)
+            self._signature = self.backend.signature()
+            self._publish(locations)
+
+    def append(self, location):
+        """追加一个景点，等待所在批次提交后返回新快照"""
+        return self.submit(location).result()
+
+    def submit(self, location):
+        """把景点放入写队列，返回提交结果的Future"""
+        future = Future()
+        location = dict(location)
+        location["location"] = tuple(location["location"])
+        self._queue.put((location, future))
+        self._ensure_writer()
+        return future
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name="location-writer", daemon=True)
+                    self._writer.start()
+
+    def _next_batch(self):
+        """取出一个时间窗口内到达的全部插入"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.commit_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._next_batch()
+            new_locations = [loc for loc, _ in batch]
+            try:
+                with self._exclusive():
+                    self._refresh()
+                    # 整体重写的后端才会遍历全部景点
+                    all_locations = chain(self._snapshot, new_locations)
+                    self.backend.append(new_locations, all_locations)
+                    self._signature = self.backend.signature()
+                    self._publish(None, new_locations)
+                    snapshot = self._snapshot
+            except Exception as e:
+                self.logger.error(f"批量写入 {len(batch)} 个景点失败: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for _, future in batch:
+                future.set_result(snapshot)